@@ -0,0 +1,20 @@
+"""Assessment logic of the Adrenal Mass Approach app, usable without Streamlit."""
+
+import importlib
+
+# Exports are resolved on first access so that importing a submodule, as the app
+# does, does not pull in pandas through the batch engine.
+_EXPORTS = {
+    "CaseFeatures": "adrenal.features",
+    "DerivedFeatures": "adrenal.features",
+    "assess_case": "adrenal.assessment",
+    "assess_cohort": "adrenal.batch",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'adrenal' has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name]), name)
@@ -0,0 +1,255 @@
+"""Assessment of a single case, as shown by the app after pressing "Assess".
+
+The rules of the results and conclusion columns are nodes of
+``ASSESSMENT_GRAPH``, from the ``CaseFeatures`` inputs through the derived values
+(enhancement, washouts, phase flags), gathered in a ``DerivedFeatures`` record,
+to each output the app renders. ``evaluate`` runs the graph, re-running only
+what a changed input affects when given the previous evaluation, and
+``assessment_from`` turns its values into an immutable ``Assessment``.
+``assess_case`` does both for a single case.
+"""
+
+from collections import namedtuple
+
+from adrenal.features import (
+    CaseFeatures, DerivedFeatures, all_phases_of, enhancement_of, low_attenuation_of, washouts_of,
+)
+from adrenal.graph import DependencyGraph, Node
+from adrenal.rules import FINAL_CONCLUSION_TABLE, conclusion_code
+
+Assessment = namedtuple("Assessment", [
+    "small_caption_result", "derived", "benign_reasons", "malignant_reasons", "complementary_comments", "probability_comments",
+    "caption", "final_conclusion", "conclusion_rule",
+])
+Assessment.__doc__ = "What the results and conclusion columns show for one case."
+
+
+def _derived(enhancement, washout, low_attenuation, all_phases):
+    return DerivedFeatures(enhancement, *washout, low_attenuation, all_phases)
+
+
+def _low_hu(non_contrast, venous, limit):
+    return (non_contrast is not None and non_contrast < limit) or (venous is not None and venous < limit)
+
+
+def _small_caption_result(non_contrast, venous, size):
+    if _low_hu(non_contrast, venous, 10) and (size is not None and size < 10):
+        return "Benign"
+    return ""
+
+
+def _benign_reasons(non_contrast, venous, size, fat_percent):
+    benign_reasons = []
+    # Small caption logic
+    if _low_hu(non_contrast, venous, 10) and (size is not None and size < 10):
+        pass
+    elif _low_hu(non_contrast, venous, 10) or (size is not None and size < 10):
+        benign_reasons.append("no enhancement (HU change < 10)")
+
+    if fat_percent is not None and fat_percent > 24:
+        benign_reasons.append("fat percent > 24% on DECT")
+    return tuple(benign_reasons)
+
+
+def _malignant_reasons(non_contrast, venous, size, enhancement, washout, bilateral, mass_dev, heterogen):
+    malignant_reasons = []
+    if venous is not None and non_contrast is not None:
+        if enhancement > 20:
+            malignant_reasons.append("enhancement (HU change > 20)")
+    elif venous is not None and non_contrast is None:
+        if venous > 40:
+            malignant_reasons.append("HU venous > 40 (no non-contrast available)")
+
+    if bilateral:
+        malignant_reasons.append("bilateral finding")
+
+    if mass_dev == "Increased >5 mm/year":
+        malignant_reasons.append("growth > 5 mm/year")
+
+    if venous is not None and non_contrast is not None:
+        if (venous > 20 or non_contrast > 20) and not (enhancement < 10 and venous > 20):
+            malignant_reasons.append("high HU >20 without hematoma pattern")
+
+    if size is not None and size > 34:
+        malignant_reasons.append("size > 3.4 cm")
+
+    if heterogen:
+        malignant_reasons.append("heterogenicity")
+
+    abs_washout, rel_washout, _ = washout
+    if abs_washout is not None and rel_washout is not None:
+        if abs_washout < 60:
+            malignant_reasons.append("absolute washout < 60%")
+        if rel_washout < 40:
+            malignant_reasons.append("relative washout < 40%")
+    return tuple(malignant_reasons)
+
+
+def _complementary_comments(non_contrast, venous, delayed, size, fat_percent, bilateral, heterogen):
+    complementary_comments = []
+    if fat_percent is not None and fat_percent > 24:
+        complementary_comments.append("High fat percentage on dual-energy CT is a benign feature.")
+
+    if bilateral:
+        complementary_comments.append("Due to bilateral findings, consider pheochromocytoma, bilateral macronodular hyperplasia, congenital adrenal hyperplasia, ACTH-dependent Cushing, lymphoma, infection, bleeding, metastasis, granulomatous disease or 21-hydroxylase deficiency.")
+
+    if non_contrast is not None and non_contrast > 20:
+        complementary_comments.append("Due to HU > 20, check plasma metanephrines.")
+
+    if heterogen:
+        complementary_comments.append("Due to heterogenicity, check plasma metanephrines.")
+
+    if venous is not None and venous > 120:
+        complementary_comments.append("HU venous > 120 – consider hypervascular tumors such as RCC, HCC, or pheochromocytoma.")
+
+    if delayed is not None and delayed > 120:
+        complementary_comments.append("HU delayed > 120 – consider hypervascular tumors such as RCC, HCC, or pheochromocytoma.")
+
+    if all(v is not None and v > 20 for v in [non_contrast, venous, delayed]) and \
+       abs(non_contrast - venous) < 6 and abs(non_contrast - delayed) < 6:
+        complementary_comments.append("Probably hematoma – no follow-up needed.")
+
+    if size is not None and size < 50:
+        complementary_comments.append("Probability of adrenal carcinoma is very low due to size < 5 cm.")
+    return tuple(complementary_comments)
+
+
+def _probability_comments(reason_referral, age, size):
+    probability_comments = []
+    if reason_referral == "Cancer work-up":
+        probability_comments.append("The risk of malignancy because of the referral reason is 43%.")
+    elif reason_referral == "Hormonal imbalance":
+        probability_comments.append("The risk of malignancy because of the referral reason is 3%.")
+    elif reason_referral == "Incidentaloma":
+        probability_comments.append("The risk of malignancy because of the referral reason is 3%.")
+
+    if age is not None:
+        if age < 18:
+            probability_comments.append("Age-related risk of malignancy is 62%.")
+        elif 18 <= age <= 39:
+            probability_comments.append("Age-related risk of malignancy is 4%.")
+        elif 40 <= age <= 65:
+            probability_comments.append("Age-related risk of malignancy is 6%.")
+        elif age > 65:
+            probability_comments.append("Age-related risk of malignancy is 11%.")
+
+    if size is not None:
+        if size < 40:
+            probability_comments.append("Size-related risk of malignancy is 2%.")
+        elif 40 <= size <= 60:
+            probability_comments.append("Size-related risk of malignancy is 6%.")
+        elif size > 60:
+            probability_comments.append("Size-related risk of adrenal carcinoma is 25% and for metastasis is 18%.")
+    return tuple(probability_comments)
+
+
+def _malignant_signs(non_contrast, venous, delayed, size, enhancement, washout, bilateral, mass_dev, heterogen):
+    """Signs listed in the final conclusion, joined with commas."""
+    malignant_signs = []
+    if venous is not None and non_contrast is not None:
+        if enhancement > 10:
+            malignant_signs.append("enhancement >10 HU")
+    if venous is not None and non_contrast is None:
+        if venous > 40:
+            malignant_signs.append("venous HU >40 without non-contrast")
+    if bilateral:
+        malignant_signs.append("bilateral finding")
+    if mass_dev == "Increased >5 mm/year":
+        malignant_signs.append("growth >5 mm/year")
+    if size is not None and size > 40:
+        malignant_signs.append("size >4 cm")
+    if heterogen:
+        malignant_signs.append("heterogenicity")
+    abs_washout, rel_washout, _ = washout
+    if venous and delayed and non_contrast and abs_washout is not None and rel_washout is not None:
+        if abs_washout < 60:
+            malignant_signs.append("absolute washout <60%")
+        if rel_washout < 40:
+            malignant_signs.append("relative washout <40%")
+    return ", ".join(malignant_signs)
+
+
+def _caption(non_contrast, venous, size, enhancement):
+    """Immediate small caption above the final conclusion."""
+    if _low_hu(non_contrast, venous, 10) and (size is not None and size < 10):
+        return "Benign"
+    if _low_hu(non_contrast, venous, 10) or (size is not None and size < 10):
+        return "Probably benign"
+    if _low_hu(non_contrast, venous, 20) and (size is not None and size < 20):
+        return "Probably benign"
+    if _low_hu(non_contrast, venous, 40) and (size is not None and size < 40):
+        return "Possibly malignant"
+    if (
+        (
+            ((non_contrast is not None and non_contrast > 40) or
+             (venous is not None and venous > 40)) and
+            (venous is not None and non_contrast is not None and enhancement > 10)
+        ) or
+        (size is not None and size > 34)
+    ):
+        return "Probably malignant"
+    return ""
+
+
+def _conclusion_rule(size, mass_dev, history_cancer, macro_fat, fat_percent, non_contrast, venous, delayed,
+                     low_attenuation, all_phases, washout, calcification):
+    """``FINAL_CONCLUSION_RULES`` row that fires."""
+    abs_washout, rel_washout, _ = washout
+    code = conclusion_code(
+        size, mass_dev, history_cancer, macro_fat, fat_percent, non_contrast, venous, delayed, low_attenuation,
+        all_phases, abs_washout, rel_washout, calcification,
+    )
+    return FINAL_CONCLUSION_TABLE.explain(code)
+
+
+def _final_conclusion(conclusion_rule, malignant_signs):
+    return conclusion_rule.text(malignant_signs)
+
+
+ASSESSMENT_GRAPH = DependencyGraph(CaseFeatures.INPUTS, [
+    Node("enhancement", ("non_contrast", "venous"), enhancement_of),
+    Node("washout", ("non_contrast", "venous", "delayed"), washouts_of),
+    Node("low_attenuation", ("non_contrast", "venous"), low_attenuation_of),
+    Node("all_phases", ("non_contrast", "venous", "delayed"), all_phases_of),
+    Node("derived", ("enhancement", "washout", "low_attenuation", "all_phases"), _derived),
+    Node("small_caption_result", ("non_contrast", "venous", "size"), _small_caption_result),
+    Node("benign_reasons", ("non_contrast", "venous", "size", "fat_percent"), _benign_reasons),
+    Node("malignant_reasons", (
+        "non_contrast", "venous", "size", "enhancement", "washout", "bilateral", "mass_dev", "heterogen",
+    ), _malignant_reasons),
+    Node("complementary_comments", (
+        "non_contrast", "venous", "delayed", "size", "fat_percent", "bilateral", "heterogen",
+    ), _complementary_comments),
+    Node("probability_comments", ("reason_referral", "age", "size"), _probability_comments),
+    Node("malignant_signs", (
+        "non_contrast", "venous", "delayed", "size", "enhancement", "washout", "bilateral", "mass_dev", "heterogen",
+    ), _malignant_signs),
+    Node("caption", ("non_contrast", "venous", "size", "enhancement"), _caption),
+    Node("conclusion_rule", (
+        "size", "mass_dev", "history_cancer", "macro_fat", "fat_percent", "non_contrast", "venous", "delayed",
+        "low_attenuation", "all_phases", "washout", "calcification",
+    ), _conclusion_rule),
+    Node("final_conclusion", ("conclusion_rule", "malignant_signs"), _final_conclusion),
+])
+
+
+def evaluate(features, previous=None):
+    """``Evaluation`` of ``ASSESSMENT_GRAPH`` for a ``CaseFeatures``.
+
+    With the ``values`` of the previous evaluation, only the rules whose inputs
+    changed are run again.
+    """
+    return ASSESSMENT_GRAPH.evaluate({name: getattr(features, name) for name in CaseFeatures.INPUTS}, previous)
+
+
+def assessment_from(values):
+    """``Assessment`` of the ``values`` of an evaluation."""
+    return Assessment(
+        values["small_caption_result"], values["derived"], values["benign_reasons"], values["malignant_reasons"], values["complementary_comments"],
+        values["probability_comments"], values["caption"], values["final_conclusion"], values["conclusion_rule"].name,
+    )
+
+
+def assess_case(features):
+    """Run the results and conclusion rules on a ``CaseFeatures``."""
+    return assessment_from(evaluate(features).values)
@@ -0,0 +1,236 @@
+"""Benchmarks of the assessment paths on synthetic cohorts.
+
+Measures the latency of a single ``assess_case`` call (parsing included), the
+throughput of ``assess_cohort`` on cohorts of increasing size and the time of a
+Streamlit rerun of the app through the headless ``AppTest`` harness: a full
+rerun, and the rerun of the panels "Assess" redraws. Results are written as
+JSON; given the JSON of an earlier run as ``--baseline``, the command exits with
+status 1 when a median got slower by more than ``--tolerance``::
+
+    python -m adrenal.bench --output bench.json
+    python -m adrenal.bench --baseline bench.json --sizes 1000,100000
+"""
+
+import argparse
+import datetime
+import json
+import os
+import pathlib
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from adrenal.assessment import assess_case
+from adrenal.batch import assess_cohort
+from adrenal.features import CaseFeatures
+from adrenal.synthetic import form_inputs, synthetic_cohort
+
+APP = pathlib.Path(__file__).resolve().parent.parent / "adrenal_mass_app.py"
+
+# App widget label -> argument of form_inputs / CaseFeatures.from_form
+APP_TEXT_INPUTS = {
+    "Age": "age",
+    "Mass size in mm (short axis)": "mass_size",
+    "Non-contrast HU": "non_contrast_hu",
+    "Venous phase HU": "venous_phase_hu",
+    "Delayed HU": "delayed_hu",
+    "Fat percent (%)": "fat_percent",
+}
+APP_SELECTBOXES = {
+    "Reason of referral": "reason_referral",
+    "Mass development": "mass_dev",
+    "Heterogenicity": "heterogenicity",
+}
+APP_CHECKBOXES = {
+    "History of cancer": "history_cancer",
+    "Bilateral finding": "bilateral",
+    "Sign of macroscopic fat": "macro_fat",
+    "Calcification": "calcification",
+}
+APP_MODALITIES = {
+    "Non-contrast CT": "non_contrast_hu",
+    "Contrast enhanced CT": "venous_phase_hu",
+    "Dual-energy CT": "fat_percent",
+}
+
+
+def summarize(samples):
+    """Count, minimum, median, 95th percentile and mean of timings in seconds."""
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "mean": statistics.fmean(ordered),
+    }
+
+
+def bench_scalar(cases=2000, seed=0):
+    """Per-case latency of parsing the form inputs and running ``assess_case``."""
+    inputs = [form_inputs(row) for _, row in synthetic_cohort(cases, seed).iterrows()]
+    samples = []
+    for arguments in inputs:
+        started = time.perf_counter()
+        assess_case(CaseFeatures.from_form(**arguments))
+        samples.append(time.perf_counter() - started)
+    return [{"name": "scalar_assess_case", "unit": "s", **summarize(samples)}]
+
+
+def bench_batch(sizes=(1_000, 100_000, 1_000_000), repeat=3, seed=0):
+    """Time of ``assess_cohort`` per cohort size, with the rows per second of the median."""
+    results = []
+    for size in sizes:
+        cohort = synthetic_cohort(size, seed)
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            assess_cohort(cohort)
+            samples.append(time.perf_counter() - started)
+        stats = summarize(samples)
+        results.append({
+            "name": f"batch_assess_cohort_{size}", "unit": "s", "rows": size,
+            "rows_per_second": size / stats["median"], **stats,
+        })
+    return results
+
+
+def _by_label(elements, label):
+    return next(element for element in elements if element.label == label)
+
+
+def _fill_form(at, arguments):
+    """Enter a case on the form of a running ``AppTest``."""
+    for label, argument in APP_MODALITIES.items():
+        _by_label(at.checkbox, label).set_value(bool(arguments[argument]))
+    at.run()
+    for label, argument in APP_TEXT_INPUTS.items():
+        widgets = [widget for widget in at.text_input if widget.label == label]
+        if widgets:
+            widgets[0].set_value(arguments[argument])
+    for label, argument in APP_SELECTBOXES.items():
+        _by_label(at.selectbox, label).set_value(arguments[argument])
+    for label, argument in APP_CHECKBOXES.items():
+        checkbox = _by_label(at.checkbox, label)
+        if not checkbox.disabled:
+            checkbox.set_value(arguments[argument])
+    at.run()
+
+
+def bench_reruns(app=APP, reruns=20, seed=0):
+    """Time of a full app rerun with the form filled in and of the rerun after "Assess".
+
+    Every rerun uses a different synthetic case, so "Assess" is never served
+    from the assessment cache. Cases are stored in a temporary database.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    inputs = [form_inputs(row) for _, row in synthetic_cohort(reruns, seed + 1).iterrows()]
+    plain, assessed = [], []
+    with tempfile.TemporaryDirectory() as directory:
+        previous = os.environ.get("ADRENAL_CASE_DB")
+        os.environ["ADRENAL_CASE_DB"] = os.path.join(directory, "cases.db")
+        try:
+            at = AppTest.from_file(str(app), default_timeout=60).run()
+            for arguments in inputs:
+                _fill_form(at, arguments)
+                started = time.perf_counter()
+                at.run()
+                plain.append(time.perf_counter() - started)
+
+                _by_label(at.button, "Assess").click()
+                started = time.perf_counter()
+                at.run()
+                assessed.append(time.perf_counter() - started)
+                if at.exception:
+                    raise RuntimeError(f"app raised during the benchmark: {at.exception[0].message}")
+                # "Assess" only reruns the result panels; bring back the whole page for the next case
+                at.run()
+        finally:
+            if previous is None:
+                os.environ.pop("ADRENAL_CASE_DB", None)
+            else:
+                os.environ["ADRENAL_CASE_DB"] = previous
+    return [
+        {"name": "app_rerun", "unit": "s", **summarize(plain)},
+        {"name": "app_rerun_assess", "unit": "s", **summarize(assessed)},
+    ]
+
+
+def environment():
+    """Versions and machine the results were measured with."""
+    import numpy
+    import pandas
+
+    versions = {"python": platform.python_version(), "numpy": numpy.__version__, "pandas": pandas.__version__}
+    try:
+        import streamlit
+
+        versions["streamlit"] = streamlit.__version__
+    except ImportError:
+        pass
+    return {"platform": platform.platform(), "machine": platform.machine(), "cpus": os.cpu_count(), **versions}
+
+
+def regressions(results, baseline, tolerance):
+    """Benchmarks whose median grew by more than ``tolerance`` over the baseline.
+
+    Returns ``(name, baseline_median, median)`` tuples.
+    """
+    previous = {result["name"]: result["median"] for result in baseline["results"]}
+    return [
+        (result["name"], previous[result["name"]], result["median"])
+        for result in results
+        if result["name"] in previous and result["median"] > previous[result["name"]] * (1 + tolerance)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m adrenal.bench",
+        description="Benchmark single-case latency, batch throughput and app reruns.",
+    )
+    parser.add_argument("--output", default="-", help="JSON results file, '-' for stdout (default)")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="comma-separated batch sizes (default: 1000,100000,1000000)")
+    parser.add_argument("--scalar-cases", type=int, default=2000, help="cases timed one by one (default: 2000)")
+    parser.add_argument("--reruns", type=int, default=20, help="app reruns timed per mode (default: 20)")
+    parser.add_argument("--skip-app", action="store_true", help="do not time app reruns")
+    parser.add_argument("--app", default=str(APP), help="path of the Streamlit app")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic cohorts (default: 0)")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown over the baseline (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    results = bench_scalar(args.scalar_cases, args.seed)
+    results += bench_batch([int(size) for size in args.sizes.split(",") if size], seed=args.seed)
+    if not args.skip_app:
+        results += bench_reruns(args.app, args.reruns, args.seed)
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        pathlib.Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+    for result in results:
+        print(f"{result['name']:<32} median {result['median'] * 1000:10.3f} ms  p95 {result['p95'] * 1000:10.3f} ms",
+              file=sys.stderr)
+    if args.baseline:
+        baseline = json.loads(pathlib.Path(args.baseline).read_text(encoding="utf-8"))
+        slower = regressions(results, baseline, args.tolerance)
+        for name, before, after in slower:
+            print(f"REGRESSION {name}: median {before * 1000:.3f} ms -> {after * 1000:.3f} ms", file=sys.stderr)
+        if slower:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""Thread-safe LRU cache for assessments shared by all app sessions."""
+
+import threading
+from collections import OrderedDict, namedtuple
+
+CacheStats = namedtuple("CacheStats", ["hits", "misses", "size", "maxsize"])
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry.
+
+    All app sessions run in threads of the same server process, so every access
+    goes through a lock. Values are computed outside the lock; when two sessions
+    miss on the same key at once, both compute and the second result is kept.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """Return the value cached for ``key``, calling ``compute(key)`` on a miss."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = compute(key)
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(self.hits, self.misses, len(self._data), self.maxsize)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
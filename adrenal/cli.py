@@ -0,0 +1,155 @@
+"""Headless scoring of exported case files.
+
+Reads a case file in the layout of the app's report export (``;``-separated,
+``utf-8-sig``) or as Parquet, assesses it in chunks on a process pool and
+streams the scored rows to the output file in input order. At most a few
+chunks per worker are held in memory at any time, so files far larger than
+RAM can be processed::
+
+    python -m adrenal.cli cases.csv scored.csv
+    python -m adrenal.cli cases.parquet scored.parquet --workers 8 --chunksize 100000
+"""
+
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from adrenal.batch import assess_cohort
+
+CSV_OPTIONS = dict(sep=";", encoding="utf-8-sig")
+
+
+def _format(path, fmt):
+    if fmt:
+        return fmt
+    return "parquet" if str(path).lower().endswith((".parquet", ".pq")) else "csv"
+
+
+def read_chunks(path, fmt=None, chunksize=50_000):
+    """Yield the cases of ``path`` as DataFrames of at most ``chunksize`` rows."""
+    if _format(path, fmt) == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+
+    source = sys.stdin.buffer if path == "-" else path
+    # Keep every cell as text so values are parsed exactly like the form inputs
+    yield from pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunksize, **CSV_OPTIONS)
+
+
+class _CsvWriter:
+    def __init__(self, path):
+        if path == "-":
+            self.handle, self.owned = sys.stdout, False
+        else:
+            self.handle, self.owned = open(path, "w", encoding=CSV_OPTIONS["encoding"], newline=""), True
+        self.header = True
+
+    def write(self, df):
+        df.to_csv(self.handle, index=False, sep=CSV_OPTIONS["sep"], header=self.header)
+        self.header = False
+
+    def close(self):
+        if self.owned:
+            self.handle.close()
+        else:
+            self.handle.flush()
+
+
+class _ParquetWriter:
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            # Later chunks are cast to the schema fixed by the first one
+            table = pa.Table.from_pandas(df, schema=self.writer.schema, preserve_index=False)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_writer(path, fmt=None):
+    """Return a chunk writer for ``path`` with ``write(df)`` and ``close()``."""
+    if _format(path, fmt) == "parquet":
+        return _ParquetWriter(path)
+    return _CsvWriter(path)
+
+
+def score_file(source, destination, source_format=None, destination_format=None, chunksize=50_000, workers=None):
+    """Assess every case of ``source`` and write the scored rows to ``destination``.
+
+    Returns the number of cases written. With ``workers=1`` the chunks are scored
+    in this process, otherwise on a pool of ``workers`` processes (default: one per
+    CPU) with no more than two chunks per worker in flight.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = read_chunks(source, source_format, chunksize)
+    writer = open_writer(destination, destination_format)
+    written = 0
+    try:
+        if workers == 1:
+            for chunk in chunks:
+                writer.write(assess_cohort(chunk))
+                written += len(chunk)
+            return written
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(assess_cohort, chunk))
+                if len(pending) >= 2 * workers:
+                    scored = pending.popleft().result()
+                    writer.write(scored)
+                    written += len(scored)
+            while pending:
+                scored = pending.popleft().result()
+                writer.write(scored)
+                written += len(scored)
+        return written
+    finally:
+        writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m adrenal.cli",
+        description="Score exported adrenal mass cases with the app's assessment rules.",
+    )
+    parser.add_argument("source", help="case file (.csv in the report layout or .parquet), '-' for CSV on stdin")
+    parser.add_argument("destination", help="output file (.csv or .parquet), '-' for CSV on stdout")
+    parser.add_argument("--input-format", choices=["csv", "parquet"], help="override the format guessed from the source name")
+    parser.add_argument("--output-format", choices=["csv", "parquet"], help="override the format guessed from the destination name")
+    parser.add_argument("--chunksize", type=int, default=50_000, help="cases per chunk (default: 50000)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    written = score_file(
+        args.source,
+        args.destination,
+        source_format=args.input_format,
+        destination_format=args.output_format,
+        chunksize=args.chunksize,
+        workers=args.workers,
+    )
+    print(f"Scored {written} cases.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""Compact typed columns for large cohorts in the report export layout.
+
+``CompactCohort`` holds a cohort read from the export CSV as typed arrays
+instead of a DataFrame of text: sizes and HU values as float32 (NaN when
+missing), the age as int16, the selects and other text columns as integer codes
+into their distinct values, and the checkboxes as the bits of one small integer
+per case. Cells whose text does not come back from the typed value (unparsable
+input, "12.30" typed for 12.3, a checkbox written as "1") are kept verbatim, so
+``to_frame`` and ``write_csv`` give back the text that was read. The washout
+columns are derived values written with full precision, so they are held as
+float64.
+"""
+
+import io
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from adrenal.batch import (
+    ABS_WASHOUT, AGE, CHECKBOX_COLUMNS, DELAYED_HU, FAT_PERCENT, MASS_SIZE, NON_CONTRAST_HU, REL_WASHOUT,
+    VENOUS_PHASE_HU, VIRTUAL_NC_HU,
+)
+
+FLOAT_COLUMNS = [MASS_SIZE, NON_CONTRAST_HU, VENOUS_PHASE_HU, DELAYED_HU, VIRTUAL_NC_HU, FAT_PERCENT]
+DERIVED_COLUMNS = [ABS_WASHOUT, REL_WASHOUT]
+INT_COLUMNS = [AGE]
+
+# int16 value of a missing age
+INT_MISSING = np.iinfo(np.int16).min
+
+CSV_OPTIONS = dict(sep=";", encoding="utf-8-sig")
+
+
+def _cells(series):
+    """Column as an object array of text, missing cells as ''."""
+    if series.dtype != object:
+        return series.astype(str).where(series.notna(), "").to_numpy(dtype=object)
+    return series.where(series.notna(), "").to_numpy(dtype=object)
+
+
+def _number(cell):
+    try:
+        return float(cell)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _parse_numbers(cells):
+    """Cells as float64, NaN where not a number; values repeat a lot, so each distinct one is parsed once.
+
+    ``float`` is used rather than ``pandas.to_numeric``, whose parser can be off
+    by one unit in the last place.
+    """
+    inverse, uniques = pd.factorize(cells)
+    return np.array([_number(cell) for cell in uniques] + [np.nan], dtype=float)[inverse]
+
+
+def _format_floats(values, trailing_zero):
+    """Shortest text of each value at its precision, '' for NaN, formatting every distinct value once."""
+    text = np.full(len(values), "", dtype=object)
+    present = ~np.isnan(values)
+    uniques, inverse = np.unique(values[present], return_inverse=True)
+    formatted = np.array([np.format_float_positional(value, trim="-") for value in uniques] + [""], dtype=object)
+    if trailing_zero:
+        integral = np.isfinite(uniques) & (uniques == np.floor(uniques))
+        formatted[:-1][integral] = formatted[:-1][integral] + ".0"
+    text[present] = formatted[inverse.reshape(-1)]
+    # np.unique does not tell 0 from -0 apart, so zeros take their sign from each value
+    zero = np.flatnonzero(values == 0)
+    if len(zero):
+        unsigned = "0.0" if trailing_zero else "0"
+        text[zero] = np.where(np.signbit(values[zero]), "-" + unsigned, unsigned)
+    return text
+
+
+def _format_ints(values):
+    text = np.full(len(values), "", dtype=object)
+    present = values != INT_MISSING
+    uniques, inverse = np.unique(values[present], return_inverse=True)
+    text[present] = np.array([str(value) for value in uniques] + [""], dtype=object)[inverse.reshape(-1)]
+    return text
+
+
+def _exceptions(cells, formatted):
+    rows = np.flatnonzero(cells != formatted)
+    return rows, cells[rows]
+
+
+def _codes(uniques, inverse):
+    return inverse.astype(np.min_scalar_type(max(len(uniques) - 1, 0)))
+
+
+class CompactCohort:
+    """Typed, columnar cohort with the columns of a report export.
+
+    Build one with ``from_frame`` or ``read_csv``. Typed columns are read with
+    ``values`` and ``flag``, ``isin`` matches text columns on their codes, and
+    ``select`` keeps the cases of a boolean mask.
+    """
+
+    def __init__(self, length, columns, numbers, trailing_zero, categories, codes, flag_columns, flags, exceptions):
+        self._length = length
+        self.columns = list(columns)
+        self._numbers = numbers
+        self._trailing_zero = trailing_zero
+        self._categories = categories
+        self._codes = codes
+        self._flag_columns = list(flag_columns)
+        self._flags = flags
+        self._exceptions = exceptions
+
+    @classmethod
+    def from_frame(cls, df, trailing_zero=None):
+        """Encode a DataFrame of export cells, read as text.
+
+        ``trailing_zero`` maps float columns to whether whole numbers are
+        written with ".0"; by default the way most cells are written is used.
+        """
+        trailing_zero = dict(trailing_zero or {})
+        numbers, categories, codes, exceptions = {}, {}, {}, {}
+        flag_columns = [column for column in CHECKBOX_COLUMNS if column in df]
+        flags = np.zeros(len(df), dtype=np.min_scalar_type((1 << len(flag_columns)) - 1))
+
+        for column in df.columns:
+            cells = _cells(df[column])
+            if column in FLOAT_COLUMNS or column in DERIVED_COLUMNS:
+                values = _parse_numbers(cells)
+                if column in FLOAT_COLUMNS:
+                    values = values.astype(np.float32)
+                if column not in trailing_zero:
+                    integral = ~np.isnan(values) & (values == np.floor(values))
+                    ends = pd.Series(cells[integral]).str.endswith(".0")
+                    trailing_zero[column] = bool(len(ends)) and ends.mean() > 0.5
+                numbers[column] = values
+                formatted = _format_floats(values, trailing_zero[column])
+            elif column in INT_COLUMNS:
+                parsed = _parse_numbers(cells)
+                ok = (np.isfinite(parsed) & (parsed == np.floor(parsed)) &
+                      (parsed > INT_MISSING) & (parsed <= np.iinfo(np.int16).max))
+                values = np.where(ok, parsed, INT_MISSING).astype(np.int16)
+                numbers[column] = values
+                formatted = _format_ints(values)
+            elif column in flag_columns:
+                bit = flag_columns.index(column)
+                checked = pd.Series(cells, dtype=object).astype(str).str.strip().str.lower().isin(["true", "1", "yes"])
+                flags |= checked.to_numpy().astype(flags.dtype) << bit
+                formatted = np.where(checked.to_numpy(), "True", "False").astype(object)
+            else:
+                inverse, uniques = pd.factorize(cells)
+                categories[column] = uniques.astype(object)
+                codes[column] = _codes(uniques, inverse)
+                continue
+            rows, texts = _exceptions(cells, formatted)
+            if len(rows):
+                exceptions[column] = (rows, texts)
+
+        return cls(len(df), df.columns, numbers, trailing_zero, categories, codes, flag_columns, flags, exceptions)
+
+    @classmethod
+    def read_csv(cls, source, chunksize=100_000):
+        """Read an export CSV (path or file-like) chunk by chunk, so its text is never all in memory."""
+        parts = []
+        trailing_zero = None
+        for chunk in pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunksize, **CSV_OPTIONS):
+            parts.append(cls.from_frame(chunk, trailing_zero))
+            trailing_zero = parts[0]._trailing_zero
+        return cls.concat(parts)
+
+    @classmethod
+    def concat(cls, parts):
+        """One cohort of the cases of ``parts``, which share their columns."""
+        first = parts[0]
+        offsets = np.cumsum([0] + [len(part) for part in parts])
+        numbers = {column: np.concatenate([part._numbers[column] for part in parts]) for column in first._numbers}
+        categories, codes = {}, {}
+        for column in first._categories:
+            merged = pd.Index(np.concatenate([part._categories[column] for part in parts])).unique()
+            categories[column] = merged.to_numpy(dtype=object)
+            codes[column] = _codes(merged, np.concatenate([
+                merged.get_indexer(part._categories[column])[part._codes[column]] for part in parts
+            ]))
+        exceptions = {}
+        for column in first.columns:
+            found = [(part._exceptions[column], offset) for part, offset in zip(parts, offsets)
+                     if column in part._exceptions]
+            if found:
+                exceptions[column] = (
+                    np.concatenate([rows + offset for (rows, _), offset in found]),
+                    np.concatenate([texts for (_, texts), _ in found]),
+                )
+        flags = np.concatenate([part._flags for part in parts])
+        return cls(int(offsets[-1]), first.columns, numbers, first._trailing_zero, categories, codes,
+                   first._flag_columns, flags, exceptions)
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the encoded columns."""
+        total = self._flags.nbytes
+        total += sum(values.nbytes for values in self._numbers.values())
+        total += sum(codes.nbytes for codes in self._codes.values())
+        for texts in self._categories.values():
+            total += texts.nbytes + sum(len(text) + 49 for text in texts)
+        for rows, texts in self._exceptions.values():
+            total += rows.nbytes + texts.nbytes + sum(len(text) + 49 for text in texts)
+        return total
+
+    def values(self, column):
+        """Typed values of a column.
+
+        Numbers come as float32 (float64 for the washouts) with NaN where
+        missing or unparsable, checkboxes as booleans and text columns as a
+        ``pandas.Categorical``.
+        """
+        if column in self._flag_columns:
+            return self.flag(column)
+        if column in self._numbers:
+            values = self._numbers[column]
+            if column in INT_COLUMNS:
+                return np.where(values == INT_MISSING, np.nan, values).astype(np.float32)
+            return values
+        return pd.Categorical.from_codes(self._codes[column], self._categories[column])
+
+    def flag(self, column):
+        """Boolean array of a checkbox column."""
+        return (self._flags >> self._flag_columns.index(column) & 1).astype(bool)
+
+    def isin(self, column, texts):
+        """Boolean array of the cases whose text column holds one of ``texts``."""
+        wanted = np.flatnonzero(pd.Index(self._categories[column]).isin(list(texts)))
+        return np.isin(self._codes[column], wanted)
+
+    def select(self, mask):
+        """Cohort of the cases where the boolean ``mask`` is set."""
+        mask = np.asarray(mask, dtype=bool)
+        positions = np.cumsum(mask) - 1
+        exceptions = {}
+        for column, (rows, texts) in self._exceptions.items():
+            keep = mask[rows]
+            if keep.any():
+                exceptions[column] = (positions[rows[keep]], texts[keep])
+        return CompactCohort(
+            int(mask.sum()), self.columns,
+            {column: values[mask] for column, values in self._numbers.items()}, self._trailing_zero,
+            self._categories, {column: codes[mask] for column, codes in self._codes.items()},
+            self._flag_columns, self._flags[mask], exceptions,
+        )
+
+    def to_frame(self, start=0, stop=None):
+        """Text cells of cases ``start`` to ``stop``, as they were read."""
+        stop = self._length if stop is None else min(stop, self._length)
+        cells = {}
+        for column in self.columns:
+            if column in self._flag_columns:
+                text = np.where(self.flag(column)[start:stop], "True", "False").astype(object)
+            elif column in INT_COLUMNS:
+                text = _format_ints(self._numbers[column][start:stop])
+            elif column in self._numbers:
+                text = _format_floats(self._numbers[column][start:stop], self._trailing_zero[column])
+            else:
+                text = self._categories[column][self._codes[column][start:stop]]
+            if column in self._exceptions:
+                rows, texts = self._exceptions[column]
+                first, last = np.searchsorted(rows, [start, stop])
+                text[rows[first:last] - start] = texts[first:last]
+            cells[column] = text
+        return pd.DataFrame(cells, columns=self.columns, index=pd.RangeIndex(start, stop))
+
+    def write_csv(self, target, chunksize=100_000):
+        """Write the cohort as an export CSV to a path or a text handle."""
+        if isinstance(target, (str, os.PathLike)):
+            with open(target, "w", encoding=CSV_OPTIONS["encoding"], newline="") as handle:
+                return self.write_csv(handle, chunksize)
+        for start in range(0, max(self._length, 1), chunksize):
+            self.to_frame(start, start + chunksize).to_csv(
+                target, sep=CSV_OPTIONS["sep"], index=False, header=start == 0, lineterminator="\n",
+            )
+
+    def csv_file(self):
+        """The cohort as an export CSV temporary file, rewound for reading."""
+        handle = tempfile.TemporaryFile()
+        text = io.TextIOWrapper(handle, encoding=CSV_OPTIONS["encoding"], newline="")
+        self.write_csv(text)
+        text.flush()
+        text.detach()
+        handle.seek(0)
+        return handle
@@ -0,0 +1,69 @@
+"""Report serialization for the "Save Report" downloads.
+
+Reports are lists of row dicts keyed by ``REPORT_COLUMNS``. The CSV writer only
+needs the standard library and produces the same ``;``-separated ``utf-8-sig``
+bytes the app used to get from pandas. Parquet goes through pyarrow, which is
+imported on first use.
+"""
+
+import csv
+import importlib.util
+import io
+
+REPORT_COLUMNS = [
+    "Patient ID",
+    "Age",
+    "Mass Size (mm)",
+    "History of Cancer",
+    "Reason of Referral",
+    "Non-contrast CT Used",
+    "Contrast Enhanced CT Used",
+    "Dual-energy CT Used",
+    "Non-contrast HU",
+    "Venous phase HU",
+    "Delayed HU",
+    "Virtual non-contrast HU",
+    "Fat Percent (%)",
+    "Absolute Washout (%)",
+    "Relative Washout (%)",
+    "Mass Development",
+    "Bilateral Finding",
+    "Heterogenicity",
+    "Macroscopic Fat",
+    "Cystic",
+    "Calcification",
+    "Additional Comments",
+    "Small Caption Result",
+    "Final Conclusion",
+]
+
+
+def write_report_csv(handle, rows, columns=REPORT_COLUMNS):
+    """Write report rows to a text handle one at a time, missing values as empty cells."""
+    writer = csv.writer(handle, delimiter=";", lineterminator="\n")
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([row.get(column) for column in columns])
+
+
+def report_csv(rows, columns=REPORT_COLUMNS):
+    """Serialize report rows to CSV bytes."""
+    buffer = io.StringIO()
+    write_report_csv(buffer, rows, columns)
+    return buffer.getvalue().encode("utf-8-sig")
+
+
+def parquet_available():
+    """Whether pyarrow is installed, without importing it."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def report_parquet(rows, columns=REPORT_COLUMNS):
+    """Serialize report rows to Parquet bytes."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.table({column: [row.get(column) for row in rows] for column in columns})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer)
+    return buffer.getvalue()
@@ -0,0 +1,115 @@
+"""Typed inputs parsed once per assessment, and the values derived from them.
+
+``CaseFeatures`` holds the parsed inputs and ``DerivedFeatures`` the values the
+rules compute from them. The nodes of ``adrenal.assessment.ASSESSMENT_GRAPH``
+derive those with the functions below.
+"""
+
+from collections import namedtuple
+
+DerivedFeatures = namedtuple("DerivedFeatures", [
+    "enhancement", "abs_washout", "rel_washout", "washout_error", "low_attenuation", "all_phases",
+])
+DerivedFeatures.__doc__ = """Values derived from the ``CaseFeatures`` of one case.
+
+Read by the results column, the conclusion column and the report export. The
+washouts are None unless all three phases are given and ``washout_error`` tells
+that one divided by zero.
+"""
+
+
+def enhancement_of(non_contrast, venous):
+    """HU change from the non-contrast to the venous phase, None when either is missing."""
+    return venous - non_contrast if venous is not None and non_contrast is not None else None
+
+
+def washouts_of(non_contrast, venous, delayed):
+    """``(abs_washout, rel_washout, washout_error)`` in percent.
+
+    The washouts are None unless all three phases are given. ``washout_error`` is
+    True when a washout divided by zero, leaving the ones not yet computed None.
+    """
+    abs_washout = rel_washout = None
+    washout_error = False
+    if venous is not None and delayed is not None and non_contrast is not None:
+        try:
+            abs_washout = ((venous - delayed) / (venous - non_contrast)) * 100
+            rel_washout = ((venous - delayed) / venous) * 100
+        except ZeroDivisionError:
+            washout_error = True
+    return abs_washout, rel_washout, washout_error
+
+
+def low_attenuation_of(non_contrast, venous):
+    """Whether the non-contrast or venous HU is at most 20."""
+    return (non_contrast is not None and non_contrast <= 20) or (venous is not None and venous <= 20)
+
+
+def all_phases_of(non_contrast, venous, delayed):
+    return non_contrast is not None and venous is not None and delayed is not None
+
+
+class CaseFeatures:
+    """Parsed inputs of one case.
+
+    Built once per assessment and evaluated by ``ASSESSMENT_GRAPH``, which
+    derives its ``DerivedFeatures`` from it. Instances are
+    immutable and hash on their inputs, so they double as the assessment cache
+    key.
+
+    Numeric inputs are None when missing. As in the form, a single unparsable
+    text value discards all of them.
+    """
+
+    INPUTS = (
+        "size", "non_contrast", "venous", "delayed", "fat_percent", "age",
+        "history_cancer", "reason_referral", "mass_dev", "bilateral", "heterogen", "macro_fat", "calcification",
+    )
+
+    __slots__ = INPUTS + ("_key",)
+
+    def __init__(self, size, non_contrast, venous, delayed, fat_percent, age,
+                 history_cancer, reason_referral, mass_dev, bilateral, heterogen, macro_fat, calcification):
+        key = (size, non_contrast, venous, delayed, fat_percent, age,
+               bool(history_cancer), reason_referral, mass_dev, bool(bilateral), bool(heterogen), bool(macro_fat),
+               bool(calcification))
+        for name, value in zip(self.INPUTS, key):
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, "_key", key)
+
+    @classmethod
+    def from_form(cls, age, mass_size, history_cancer, reason_referral, non_contrast_hu, venous_phase_hu, delayed_hu,
+                  fat_percent, mass_dev, bilateral, heterogenicity, macro_fat, calcification):
+        """Parse the raw form values, empty text meaning missing."""
+        try:
+            size_value = float(mass_size) if mass_size else None
+            non_contrast_val = float(non_contrast_hu) if non_contrast_hu else None
+            venous_val = float(venous_phase_hu) if venous_phase_hu else None
+            delayed_val = float(delayed_hu) if delayed_hu else None
+            fat_percent_val = float(fat_percent) if fat_percent else None
+            age_val = int(age) if age else None
+        except ValueError:
+            size_value = non_contrast_val = venous_val = delayed_val = fat_percent_val = age_val = None
+
+        return cls(
+            size_value, non_contrast_val, venous_val, delayed_val, fat_percent_val, age_val,
+            history_cancer, reason_referral, mass_dev, bilateral, heterogenicity == "Heterogen", macro_fat, calcification,
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, CaseFeatures):
+            return NotImplemented
+        return self._key == other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.INPUTS)
+        return f"{type(self).__name__}({fields})"
@@ -0,0 +1,67 @@
+"""Dependency graph of computed values with incremental re-evaluation.
+
+A ``DependencyGraph`` has named inputs and ``Node`` objects, each computed from
+inputs or earlier nodes. Given the values of an earlier evaluation,
+``evaluate`` only recomputes the nodes downstream of an input that changed, and
+stops at a node whose recomputed value equals the previous one.
+"""
+
+from collections import namedtuple
+
+Node = namedtuple("Node", ["name", "inputs", "compute"])
+Node.__doc__ = "Value ``name`` computed as ``compute(*values of inputs)``."
+
+Evaluation = namedtuple("Evaluation", ["values", "changed", "computed"])
+Evaluation.__doc__ = """Result of ``DependencyGraph.evaluate``.
+
+``values`` maps every input and node name to its value, ``changed`` is the
+frozenset of names whose value differs from the previous evaluation (all of
+them without one) and ``computed`` the names of the nodes that were run.
+"""
+
+
+class DependencyGraph:
+    """Inputs and nodes listed in dependency order."""
+
+    def __init__(self, inputs, nodes):
+        defined = set(inputs)
+        for node in nodes:
+            undefined = [name for name in node.inputs if name not in defined]
+            if undefined:
+                raise ValueError(f"node {node.name!r} depends on undefined values {undefined}")
+            if node.name in defined:
+                raise ValueError(f"{node.name!r} is defined twice")
+            defined.add(node.name)
+        self.inputs = tuple(inputs)
+        self.nodes = tuple(nodes)
+
+    def downstream(self, names):
+        """Names of the nodes that depend, directly or not, on any of ``names``."""
+        affected = set(names)
+        for node in self.nodes:
+            if affected.intersection(node.inputs):
+                affected.add(node.name)
+        return affected - set(names)
+
+    def evaluate(self, inputs, previous=None):
+        """``Evaluation`` of the graph for a mapping of input values.
+
+        ``previous`` is the ``values`` of an earlier evaluation; nodes none of
+        whose inputs changed since then keep their previous value.
+        """
+        values = {name: inputs[name] for name in self.inputs}
+        if previous is None:
+            changed = set(self.inputs)
+        else:
+            changed = {name for name in self.inputs if values[name] != previous[name]}
+        computed = []
+        for node in self.nodes:
+            if previous is not None and not changed.intersection(node.inputs):
+                values[node.name] = previous[node.name]
+                continue
+            value = node.compute(*(values[name] for name in node.inputs))
+            computed.append(node.name)
+            values[node.name] = value
+            if previous is None or value != previous[node.name]:
+                changed.add(node.name)
+        return Evaluation(values, frozenset(changed), tuple(computed))
@@ -0,0 +1,228 @@
+"""Annualized growth of a patient's mass from dated size measurements.
+
+The growth rate is the least-squares slope of size over time across all scans of
+a patient, in mm/year. The store keeps the running sums of that regression per
+patient next to the time-indexed scans, so adding a scan updates the rate in
+constant time however long the follow-up history is.
+"""
+
+import csv
+import datetime
+import io
+import math
+from collections import namedtuple
+
+from adrenal.rules import MASS_DEV_OPTIONS
+from adrenal.store import DEFAULT_PATH, connect
+
+NO_PRIOR_SCANNING, FAST_GROWTH, SLOW_GROWTH, IN_DOUBT = MASS_DEV_OPTIONS
+
+# Growth above this rate counts as "Increased >5 mm/year"
+FAST_GROWTH_MM_PER_YEAR = 5
+
+DAYS_PER_YEAR = 365.25
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    patient_id TEXT NOT NULL,
+    scan_date TEXT NOT NULL,
+    size_mm REAL NOT NULL,
+    PRIMARY KEY (patient_id, scan_date)
+);
+CREATE TABLE IF NOT EXISTS growth (
+    patient_id TEXT PRIMARY KEY,
+    origin TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    sum_t REAL NOT NULL,
+    sum_y REAL NOT NULL,
+    sum_tt REAL NOT NULL,
+    sum_ty REAL NOT NULL
+);
+"""
+
+
+def is_measured(size_mm):
+    """Whether a size is a finite, positive number of mm that can be recorded."""
+    return size_mm is not None and math.isfinite(size_mm) and size_mm > 0
+
+
+class Growth(namedtuple("Growth", ["origin", "n", "sum_t", "sum_y", "sum_tt", "sum_ty"])):
+    """Running regression sums of one patient's scans.
+
+    ``t`` is the number of days since ``origin``, ``y`` the size in mm.
+    """
+
+    @classmethod
+    def empty(cls, origin):
+        return cls(origin, 0, 0.0, 0.0, 0.0, 0.0)
+
+    def add(self, scan_date, size_mm, weight=1):
+        """Sums with a scan added, or removed when ``weight`` is -1."""
+        t = (scan_date - self.origin).days
+        return Growth(
+            self.origin,
+            self.n + weight,
+            self.sum_t + weight * t,
+            self.sum_y + weight * size_mm,
+            self.sum_tt + weight * t * t,
+            self.sum_ty + weight * t * size_mm,
+        )
+
+    @property
+    def rate(self):
+        """Growth in mm/year, or None without two scans on different days."""
+        spread = self.n * self.sum_tt - self.sum_t ** 2
+        if self.n < 2 or spread <= 0:
+            return None
+        return (self.n * self.sum_ty - self.sum_t * self.sum_y) / spread * DAYS_PER_YEAR
+
+    @property
+    def category(self):
+        """The "Mass development" option matching the measured growth."""
+        if self.n < 2:
+            return NO_PRIOR_SCANNING
+        rate = self.rate
+        if rate is None:
+            return IN_DOUBT
+        return FAST_GROWTH if rate > FAST_GROWTH_MM_PER_YEAR else SLOW_GROWTH
+
+
+class GrowthStore:
+    """Dated size measurements per patient with incrementally updated growth."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        with connect(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _load(self, conn, patient_id):
+        row = conn.execute("SELECT * FROM growth WHERE patient_id = ?", (patient_id,)).fetchone()
+        if row is None:
+            return None
+        return Growth(datetime.date.fromisoformat(row["origin"]), row["n"], row["sum_t"], row["sum_y"],
+                      row["sum_tt"], row["sum_ty"])
+
+    def _scan(self, conn, patient_id, scan_date):
+        row = conn.execute(
+            "SELECT size_mm FROM scans WHERE patient_id = ? AND scan_date = ?",
+            (patient_id, scan_date.isoformat()),
+        ).fetchone()
+        return None if row is None else row["size_mm"]
+
+    def _add(self, conn, patient_id, scan_date, size_mm):
+        if not conn.in_transaction:
+            # Take the write lock before reading the sums, so concurrent scans of a patient are not lost
+            conn.execute("BEGIN IMMEDIATE")
+        growth = self._load(conn, patient_id) or Growth.empty(scan_date)
+        previous = self._scan(conn, patient_id, scan_date)
+        if previous is not None:
+            # A second measurement on the same day replaces the first
+            growth = growth.add(scan_date, previous, weight=-1)
+        growth = growth.add(scan_date, size_mm)
+        conn.execute(
+            "INSERT INTO scans (patient_id, scan_date, size_mm) VALUES (?, ?, ?) "
+            "ON CONFLICT (patient_id, scan_date) DO UPDATE SET size_mm = excluded.size_mm",
+            (patient_id, scan_date.isoformat(), size_mm),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO growth (patient_id, origin, n, sum_t, sum_y, sum_tt, sum_ty) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (patient_id, growth.origin.isoformat()) + tuple(growth[1:]),
+        )
+        return growth
+
+    def add_scan(self, patient_id, scan_date, size_mm):
+        """Record a measurement and return the patient's updated ``Growth``.
+
+        Raises ValueError unless the size ``is_measured``.
+        """
+        size_mm = float(size_mm)
+        if not is_measured(size_mm):
+            raise ValueError(f"cannot record a size of {size_mm} mm")
+        with connect(self.path) as conn:
+            return self._add(conn, patient_id, scan_date, size_mm)
+
+    def import_csv(self, text):
+        """Add the scans of a ``;``-separated file with patient_id, scan_date and size_mm columns.
+
+        Rows without a patient id, with a date that is not ISO (YYYY-MM-DD) or
+        with a size that is not a finite, positive number are skipped. Returns
+        the numbers of scans imported and of rows skipped.
+        """
+        imported = skipped = 0
+        with connect(self.path) as conn:
+            for row in csv.DictReader(io.StringIO(text.lstrip("\ufeff")), delimiter=";"):
+                try:
+                    patient_id = row["patient_id"].strip()
+                    scan_date = datetime.date.fromisoformat(row["scan_date"].strip())
+                    size_mm = float(row["size_mm"])
+                except (AttributeError, KeyError, TypeError, ValueError):
+                    # A missing column or a short row leaves the value None
+                    patient_id = size_mm = None
+                if not patient_id or not is_measured(size_mm):
+                    skipped += 1
+                    continue
+                self._add(conn, patient_id, scan_date, size_mm)
+                imported += 1
+        return imported, skipped
+
+    def growth(self, patient_id, scan_date=None, size_mm=None):
+        """The patient's ``Growth``, including a current measurement if one is given.
+
+        The current measurement is not stored; it replaces a stored scan of the
+        same day.
+        """
+        with connect(self.path) as conn:
+            growth = self._load(conn, patient_id)
+            if scan_date is None or size_mm is None:
+                return growth
+            if growth is None:
+                return Growth.empty(scan_date).add(scan_date, size_mm)
+            previous = self._scan(conn, patient_id, scan_date)
+        if previous is not None:
+            growth = growth.add(scan_date, previous, weight=-1)
+        return growth.add(scan_date, size_mm)
+
+    def history(self, patient_id):
+        """All scans of a patient as (date, size) pairs, oldest first."""
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT scan_date, size_mm FROM scans WHERE patient_id = ? ORDER BY scan_date", (patient_id,)
+            ).fetchall()
+        return [(datetime.date.fromisoformat(row["scan_date"]), row["size_mm"]) for row in rows]
+
+
+def cohort_growth(scans):
+    """Growth of every patient in a DataFrame of scans.
+
+    ``scans`` has "patient_id", "scan_date" and "size_mm" columns. Returns one row
+    per patient with the number of scans, the rate in mm/year and the matching
+    "Mass development" option, computed with grouped sums rather than a loop.
+    """
+    import numpy as np
+    import pandas as pd
+
+    days = pd.to_datetime(scans["scan_date"]).to_numpy("datetime64[D]").astype(np.int64)
+    frame = pd.DataFrame({
+        "patient_id": scans["patient_id"].to_numpy(),
+        "t": days.astype(float),
+        "y": scans["size_mm"].astype(float).to_numpy(),
+    })
+    # Center times per patient to keep the sums small
+    frame["t"] -= frame.groupby("patient_id")["t"].transform("min")
+    frame["tt"] = frame["t"] ** 2
+    frame["ty"] = frame["t"] * frame["y"]
+    sums = frame.groupby("patient_id").agg(
+        n=("t", "size"), sum_t=("t", "sum"), sum_y=("y", "sum"), sum_tt=("tt", "sum"), sum_ty=("ty", "sum"),
+    )
+
+    spread = sums["n"] * sums["sum_tt"] - sums["sum_t"] ** 2
+    valid = (sums["n"] >= 2) & (spread > 0)
+    rate = ((sums["n"] * sums["sum_ty"] - sums["sum_t"] * sums["sum_y"]) / spread.where(valid)) * DAYS_PER_YEAR
+    category = np.select(
+        [sums["n"] < 2, ~valid, rate > FAST_GROWTH_MM_PER_YEAR],
+        [NO_PRIOR_SCANNING, IN_DOUBT, FAST_GROWTH],
+        default=SLOW_GROWTH,
+    )
+    return pd.DataFrame({"n_scans": sums["n"], "growth_mm_per_year": rate, "mass_dev": category}, index=sums.index)
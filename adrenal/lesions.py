@@ -0,0 +1,148 @@
+"""Several lesions per patient, assessed in one pass.
+
+A lesion table has one row per lesion in the layout of the report export, plus
+the patient ID, a lesion label and the side ("Left" or "Right"). The
+patient-level inputs (age, history of cancer, referral reason) are repeated on
+every lesion of a patient. ``assess_lesions`` scores all lesions of all patients
+with a single ``assess_cohort`` call and ``patient_summary`` condenses the
+scored lesions to one row per patient.
+"""
+
+import pandas as pd
+
+from adrenal.batch import (
+    ADDITIONAL_COMMENTS, AGE, BENIGN_REASONS, BILATERAL, CALCIFICATION, CAPTION, CHECKBOX_COLUMNS, CYSTIC,
+    DELAYED_HU, FAT_PERCENT, FINAL_CONCLUSION, HETEROGENICITY, HISTORY_CANCER, MACRO_FAT, MALIGNANT_REASONS,
+    MASS_DEV, MASS_SIZE, MODALITY_INPUTS, NON_CONTRAST_HU, PATIENT_ID, REASON_REFERRAL, VENOUS_PHASE_HU,
+    VIRTUAL_NC_HU, assess_cohort,
+)
+from adrenal.export import REPORT_COLUMNS
+from adrenal.sweep import CAPTIONS
+
+LESION = "Lesion"
+SIDE = "Side"
+SIDES = ["Left", "Right"]
+
+PATIENT_COLUMNS = [PATIENT_ID, AGE, HISTORY_CANCER, REASON_REFERRAL]
+LESION_COLUMNS = [
+    LESION, SIDE, MASS_SIZE, NON_CONTRAST_HU, VENOUS_PHASE_HU, DELAYED_HU, VIRTUAL_NC_HU, FAT_PERCENT, MASS_DEV,
+    HETEROGENICITY, MACRO_FAT, CYSTIC, CALCIFICATION, ADDITIONAL_COMMENTS,
+]
+
+# Export of scored lesions, one row per lesion
+LESION_REPORT_COLUMNS = [PATIENT_ID, LESION, SIDE] + [column for column in REPORT_COLUMNS if column != PATIENT_ID]
+
+
+def _text(table, column):
+    if column not in table:
+        return pd.Series("", index=table.index, dtype=object)
+    return table[column].astype(object).where(table[column].notna(), "").astype(str).str.strip()
+
+
+def read_lesions(source):
+    """Lesion table from a ``;``-separated ``utf-8-sig`` CSV (path or file-like).
+
+    Cells are read as text like the cohort CLI does, except the checkbox columns,
+    which become booleans.
+    """
+    table = pd.read_csv(source, sep=";", encoding="utf-8-sig", dtype=str, keep_default_na=False)
+    for column in CHECKBOX_COLUMNS:
+        if column in table:
+            table[column] = table[column].str.strip().str.lower().isin(["true", "1", "yes"])
+    return table
+
+
+def lesion_table(lesions, patient=None):
+    """Copy of ``lesions`` ready for ``assess_lesions``.
+
+    Empty patient-level cells of the form's patient, i.e. of the rows whose
+    patient ID is empty or that of the form, are taken from ``patient``, a
+    mapping of ``PATIENT_COLUMNS`` to the values entered on the form. Rows of
+    other patients are left as they are. A missing modality column is ticked
+    wherever one of its HU inputs is given.
+    """
+    table = pd.DataFrame(lesions).reset_index(drop=True)
+    patient = dict(patient or {})
+    patient_id = _text(table, PATIENT_ID)
+    own = (patient_id == "") | (patient_id == str(patient.get(PATIENT_ID) or "").strip())
+    for column, value in patient.items():
+        if column not in table:
+            table[column] = None
+        table[column] = table[column].where(~own | (_text(table, column) != ""), value)
+    for flag, inputs in MODALITY_INPUTS.items():
+        if flag not in table:
+            table[flag] = pd.concat([_text(table, column) != "" for column in inputs], axis=1).any(axis=1)
+    return table
+
+
+def assess_lesions(table):
+    """Score every lesion of ``table`` with one ``assess_cohort`` call.
+
+    Lesions without a label are numbered per patient, and every lesion of a
+    patient with lesions on both sides gets "Bilateral Finding". Returns the
+    scored frame, with the reason and comment columns as tuples of texts.
+    """
+    table = table.copy()
+    table[PATIENT_ID] = _text(table, PATIENT_ID)
+    table[SIDE] = _text(table, SIDE).str.capitalize()
+    patients = table.groupby(PATIENT_ID, sort=False)
+    label = _text(table, LESION)
+    table[LESION] = label.where(label != "", (patients.cumcount() + 1).astype(str))
+
+    left = (table[SIDE] == "Left").groupby(table[PATIENT_ID]).transform("any")
+    right = (table[SIDE] == "Right").groupby(table[PATIENT_ID]).transform("any")
+    if BILATERAL not in table:
+        table[BILATERAL] = False
+    table[BILATERAL] = table[BILATERAL].mask(left & right, True)
+    return assess_cohort(table, explain=True, lists=True)
+
+
+def patient_summary(scored):
+    """One row per patient of ``assess_lesions`` output.
+
+    Counts the lesions per side and those with malignant reasons, gives the
+    largest size and names the most suspicious lesion, i.e. the one with the
+    most malignant caption, then the most malignant reasons, then the largest
+    size, with its caption and final conclusion.
+    """
+    patient = scored[PATIENT_ID]
+    size = pd.to_numeric(scored[MASS_SIZE], errors="coerce")
+    malignant = scored[MALIGNANT_REASONS].map(len)
+    # CAPTIONS runs from no caption to "Probably malignant"
+    rank = pd.Series(pd.Categorical(scored[CAPTION], categories=CAPTIONS, ordered=True).codes, index=scored.index)
+
+    order = pd.DataFrame({"rank": rank, "malignant": malignant, "size": size}).sort_values(
+        ["rank", "malignant", "size"], ascending=False, kind="stable",
+    ).index
+    worst = scored.loc[order].groupby(PATIENT_ID, sort=False).head(1).set_index(PATIENT_ID)
+
+    by_patient = scored.groupby(PATIENT_ID, sort=False)
+    left = (scored[SIDE] == "Left").groupby(patient, sort=False).sum()
+    right = (scored[SIDE] == "Right").groupby(patient, sort=False).sum()
+    summary = pd.DataFrame({
+        "Lesions": by_patient.size(),
+        "Left": left,
+        "Right": right,
+        BILATERAL: (left > 0) & (right > 0),
+        "Largest Size (mm)": size.groupby(patient, sort=False).max(),
+        "Lesions With Malignant Reasons": (malignant > 0).groupby(patient, sort=False).sum(),
+        "Most Suspicious Lesion": worst[LESION],
+        CAPTION: worst[CAPTION],
+        FINAL_CONCLUSION: worst[FINAL_CONCLUSION],
+    })
+    summary.index.name = PATIENT_ID
+    return summary.reset_index()
+
+
+def lesion_reports(scored):
+    """Export rows of ``assess_lesions`` output, keyed by ``LESION_REPORT_COLUMNS``."""
+    reports = scored.reindex(columns=LESION_REPORT_COLUMNS).astype(object)
+    return reports.where(reports.notna(), None).to_dict("records")
+
+
+def lesion_results(scored):
+    """Per-lesion table for display, with the reasons joined into text."""
+    results = scored[[PATIENT_ID, LESION, SIDE, MASS_SIZE, CAPTION, FINAL_CONCLUSION]].copy()
+    for column in (BENIGN_REASONS, MALIGNANT_REASONS):
+        results[column] = scored[column].map(", ".join)
+    return results
@@ -0,0 +1,159 @@
+"""Rule hit counters and timing histograms with a Prometheus text export.
+
+``METRICS`` is the process-wide registry. Recording is off unless the
+``ADRENAL_METRICS`` environment variable is "1" or it is switched on at runtime,
+and every call site checks ``METRICS.enabled`` before doing any work, so the cost
+when it is off is one attribute lookup per assessment.
+"""
+
+import math
+import os
+import threading
+from collections import namedtuple
+
+# Upper bounds of the timing histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HELP = {
+    "adrenal_assessments_total": "Cases assessed.",
+    "adrenal_rule_hits_total": "Cases for which a result rule fired, by results column and rule text.",
+    "adrenal_conclusion_rule_total": "Cases concluded by each final-conclusion rule.",
+    "adrenal_caption_total": "Cases by caption above the final conclusion.",
+    "adrenal_washout_division_by_zero_total": "Washout calculations that divided by zero.",
+    "adrenal_assess_seconds": "Time to assess a case that was not cached.",
+    "adrenal_rerun_seconds": "Time of an app rerun.",
+    "adrenal_assessment_cache_hits_total": "Assessments served from the app's cache.",
+    "adrenal_assessment_cache_misses_total": "Assessments the app's cache had to compute.",
+    "adrenal_assessment_cache_entries": "Assessments held in the app's cache.",
+}
+
+# Result columns of an Assessment counted by rule text
+RULE_COLUMNS = ("benign_reasons", "malignant_reasons", "complementary_comments", "probability_comments")
+
+Histogram = namedtuple("Histogram", ["buckets", "count", "sum"])
+Histogram.__doc__ = "Per-bucket (not cumulative) counts, number and sum of the observations."
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class Metrics:
+    """Thread-safe registry of labelled counters, gauges and histograms.
+
+    Series are keyed by the metric name and a tuple of ``(label, value)`` pairs.
+    Values kept elsewhere, like the hit counts of a cache, are registered with
+    ``watch`` and read whenever the metrics are.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._counters = {}
+        self._histograms = {}
+        self._watched = {}
+        self._lock = threading.Lock()
+
+    def watch(self, name, read, kind="gauge", labels=()):
+        """Report ``read()`` as a "counter" or "gauge" series; registering a series again replaces it."""
+        with self._lock:
+            self._watched[(name, labels)] = (kind, read)
+
+    def inc(self, name, labels=(), value=1):
+        """Add ``value`` to a counter."""
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=()):
+        """Record a duration in a histogram."""
+        key = (name, labels)
+        with self._lock:
+            buckets, count, total = self._histograms.get(key) or ((0,) * (len(BUCKETS) + 1), 0, 0.0)
+            position = next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))
+            buckets = buckets[:position] + (buckets[position] + 1,) + buckets[position + 1:]
+            self._histograms[key] = Histogram(buckets, count + 1, total + seconds)
+
+    def _read(self, kind):
+        with self._lock:
+            watched = [(key, read) for key, (watched_kind, read) in self._watched.items() if watched_kind == kind]
+        return {key: read() for key, read in watched}
+
+    def counters(self):
+        """Copy of the counters as ``{(name, labels): value}``, watched ones included."""
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update(self._read("counter"))
+        return counters
+
+    def gauges(self):
+        """Current values of the watched gauges as ``{(name, labels): value}``."""
+        return self._read("gauge")
+
+    def histograms(self):
+        """Copy of the histograms as ``{(name, labels): Histogram}``."""
+        with self._lock:
+            return dict(self._histograms)
+
+    def reset(self):
+        """Clear the recorded series; watched ones stay registered."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def exposition(self):
+        """All series in the Prometheus text exposition format."""
+        lines = []
+        counters = sorted(self.counters().items())
+        gauges = sorted(self.gauges().items())
+        histograms = sorted(self.histograms().items())
+        for kind, series in (("counter", counters), ("gauge", gauges), ("histogram", histograms)):
+            seen = set()
+            for (name, labels), value in series:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                    lines.append(f"# TYPE {name} {kind}")
+                if kind != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (math.inf,), value.buckets):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {value.sum!r}")
+                lines.append(f"{name}_count{_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def record_assessment(self, assessment, source="app"):
+        """Count the rules that fired for one ``Assessment``."""
+        self.inc("adrenal_assessments_total", (("source", source),))
+        for column in RULE_COLUMNS:
+            for text in getattr(assessment, column):
+                self.inc("adrenal_rule_hits_total", (("column", column), ("rule", text)))
+        self.inc("adrenal_conclusion_rule_total", (("rule", assessment.conclusion_rule),))
+        self.inc("adrenal_caption_total", (("caption", assessment.caption),))
+        if assessment.derived.washout_error:
+            self.inc("adrenal_washout_division_by_zero_total")
+
+
+def quantile(histogram, q):
+    """Upper bound of the bucket holding the ``q`` quantile of a ``Histogram``."""
+    if not histogram.count:
+        return math.nan
+    rank = q * histogram.count
+    cumulative = 0
+    for bound, count in zip(BUCKETS + (math.inf,), histogram.buckets):
+        cumulative += count
+        if cumulative >= rank:
+            return bound
+    return math.inf
+
+
+METRICS = Metrics(enabled=os.environ.get("ADRENAL_METRICS") == "1")
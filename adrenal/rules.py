@@ -0,0 +1,244 @@
+"""Final-conclusion rules as an ordered decision table.
+
+Every rule of the conclusion ladder is a row of ``FINAL_CONCLUSION_RULES`` that
+constrains a handful of discrete keys (size band, mass development, history of
+cancer, fat, attenuation and washout flags). The first matching row wins, as in
+the original ``elif`` chain. ``DecisionTable`` precompiles the rows into a lookup
+index over every combination of key values, so finding the rule for a case is a
+single array lookup whatever its position in the ladder.
+"""
+
+import math
+from collections import namedtuple
+
+import numpy as np
+
+MASS_DEV_OPTIONS = ["No prior scanning", "Increased >5 mm/year", "Increased <5 mm/year", "In doubt"]
+
+# Size bands of the ladder: <=10, 10-20 (upper bound included), 20-40 and >=40 mm
+SIZE_BANDS = ["missing", "<=10", "10-20", "20-40", ">=40"]
+
+BOOL = [False, True]
+
+
+def size_band(size):
+    """Label of the ``SIZE_BANDS`` entry a size in mm falls into."""
+    if size is None or size != size:
+        return "missing"
+    if size <= 10:
+        return "<=10"
+    if size <= 20:
+        return "10-20"
+    if size < 40:
+        return "20-40"
+    return ">=40"
+
+
+def size_band_codes(size):
+    """Positions in ``SIZE_BANDS`` of an array of sizes in mm, NaN being "missing"."""
+    size = np.asarray(size, dtype=float)
+    return np.select([size <= 10, size <= 20, size < 40, size >= 40], [1, 2, 3, 4], default=0)
+
+
+# Keys of the table with their domains, most significant first
+KEYS = [
+    ("size_band", SIZE_BANDS),
+    ("mass_dev", MASS_DEV_OPTIONS + ["other"]),
+    ("history_cancer", BOOL),
+    ("macro_fat", BOOL),
+    ("high_fat_percent", BOOL),
+    ("hematoma_pattern", BOOL),
+    ("low_attenuation", BOOL),
+    ("calcification", BOOL),
+    ("all_phases", BOOL),
+    ("weak_enhancement", BOOL),
+    ("washout_suspicious", BOOL),
+    ("washout_benign", BOOL),
+]
+
+
+class Rule(namedtuple("Rule", ["name", "when", "conclusion", "consider"])):
+    """A row of the decision table.
+
+    ``when`` maps key names to the allowed value or tuple of values; keys it does
+    not mention are not constrained. ``consider`` is the spelling of "consider" in
+    the sentence appended when malignant signs are present, or None when the
+    conclusion is given as is.
+    """
+
+    def text(self, malignant_signs):
+        """Conclusion for a case with the given comma-separated malignant signs."""
+        if self.consider and malignant_signs:
+            return (
+                f"{self.conclusion} But, due to the existence of {malignant_signs}, "
+                f"{self.consider} biochemical assays to determine functional status."
+            )
+        return self.conclusion
+
+
+MID_SIZE = ("10-20", "20-40")
+FAST_OR_DOUBT = ("Increased >5 mm/year", "In doubt")
+DEPENDING = "Depending on the clinical scenario, control with adrenal CT, biopsy, PET-CT or resection should be considered, also consider biochemical assays."
+
+FINAL_CONCLUSION_RULES = [
+    Rule("large_fatty_low_attenuation", {"size_band": ">=40", "macro_fat": True, "low_attenuation": True}, "", None),
+    Rule("large_history_of_cancer", {"size_band": ">=40", "history_cancer": True},
+         "Consider biopsy or PET-CT, also consider biochemical assays.", None),
+    Rule("large", {"size_band": ">=40"}, "Consider Resection and biochemical assays.", None),
+    Rule("macroscopic_fat", {"macro_fat": True}, "The mass is probably a Myelolipoma. No follow-up needed.", "Consider"),
+    Rule("high_fat_percent", {"high_fat_percent": True},
+         "The mass is probably a Myelolipoma. No follow-up needed.", "Consider"),
+    Rule("hematoma_pattern", {"hematoma_pattern": True},
+         "There is a hematoma enhancement pattern. No follow-up needed.", "Consider"),
+    Rule("low_attenuation", {"low_attenuation": True}, "Due to low attenuation, no follow-up needed.", "Consider"),
+    Rule("calcification", {"calcification": True},
+         "Calcification of the mass is a benign sign. No follow-up needed.", "Consider"),
+    Rule("small", {"size_band": "<=10"}, "Due to small size, no follow-up needed.", "consider"),
+    Rule("10_20_no_prior", {"size_band": "10-20", "mass_dev": "No prior scanning", "history_cancer": False},
+         "Probably benign, but consider biochemical assays to determine functional status and consider adrenal CT scanning after 12 months.", None),
+    Rule("slow_growth", {"size_band": MID_SIZE, "mass_dev": "Increased <5 mm/year"},
+         "Probably benign, No follow-up needed.", "consider"),
+    Rule("growth_suspicious_washout",
+         {"size_band": MID_SIZE, "mass_dev": FAST_OR_DOUBT, "history_cancer": False, "all_phases": True, "washout_suspicious": True},
+         "Depending on the clinical scenario, Control with Adrenal CT, biopsy, PET-CT or Resection should be considered, also consider biochemical assays.", None),
+    Rule("growth", {"size_band": MID_SIZE, "mass_dev": FAST_OR_DOUBT, "history_cancer": False},
+         "Resection recommended. Consider biochemical assays and adrenal CT.", None),
+    Rule("growth_history_of_cancer", {"size_band": MID_SIZE, "mass_dev": FAST_OR_DOUBT, "history_cancer": True},
+         "Consider biopsy or PET-CT, including biochemical assays.", None),
+    Rule("20_40_incomplete_phases", {"size_band": "20-40", "mass_dev": "No prior scanning", "history_cancer": False, "all_phases": False},
+         "Consider Adrenal CT.", None),
+    Rule("20_40_weak_enhancement", {"size_band": "20-40", "mass_dev": "No prior scanning", "history_cancer": False, "weak_enhancement": True},
+         "Probably benign. No follow-up needed.", None),
+    Rule("20_40_benign_washout", {"size_band": "20-40", "mass_dev": "No prior scanning", "history_cancer": False, "washout_benign": True},
+         "Probably benign, No follow-up needed, but biochemical assays to determine functional status can be considered.", None),
+    Rule("20_40_indeterminate", {"size_band": "20-40", "mass_dev": "No prior scanning", "history_cancer": False},
+         DEPENDING, None),
+    Rule("cancer_incomplete_phases", {"size_band": MID_SIZE, "mass_dev": "No prior scanning", "history_cancer": True, "all_phases": False},
+         "Consider Adrenal CT.", None),
+    Rule("cancer_weak_enhancement", {"size_band": MID_SIZE, "mass_dev": "No prior scanning", "history_cancer": True, "weak_enhancement": True},
+         "Probably benign. No follow-up needed.", None),
+    Rule("cancer_benign_washout", {"size_band": MID_SIZE, "mass_dev": "No prior scanning", "history_cancer": True, "washout_benign": True},
+         "Probably benign. No follow-up needed. Biochemical assays may be considered.", None),
+    Rule("cancer_indeterminate", {"size_band": MID_SIZE, "mass_dev": "No prior scanning", "history_cancer": True},
+         DEPENDING, None),
+    Rule("no_matching_rule", {}, "", None),
+]
+
+
+class DecisionTable:
+    """Ordered rules compiled into a lookup index over all key combinations."""
+
+    def __init__(self, keys, rules):
+        self.keys = keys
+        self.rules = rules
+        self.radix = [len(domain) for _, domain in keys]
+        self.strides = [int(np.prod(self.radix[i + 1:], dtype=np.int64)) for i in range(len(keys))]
+        self.index = self._compile()
+
+    def _compile(self):
+        size = int(np.prod(self.radix, dtype=np.int64))
+        codes = np.arange(size)
+        positions = {
+            name: codes // stride % radix
+            for (name, _), stride, radix in zip(self.keys, self.strides, self.radix)
+        }
+        domains = dict(self.keys)
+
+        index = np.full(size, len(self.rules), dtype=np.uint8)
+        for number, rule in enumerate(self.rules):
+            match = index == len(self.rules)
+            for name, allowed in rule.when.items():
+                allowed = allowed if isinstance(allowed, tuple) else (allowed,)
+                match &= np.isin(positions[name], [domains[name].index(value) for value in allowed])
+            index[match] = number
+        if (index == len(self.rules)).any():
+            raise ValueError("decision table does not cover every key combination")
+        return index
+
+    def encode(self, **positions):
+        """Index code for the given key positions (scalars or equally shaped arrays)."""
+        code = 0
+        for (name, _), stride in zip(self.keys, self.strides):
+            code = code + np.asarray(positions[name], dtype=np.int64) * stride
+        return code
+
+    def code(self, **positions):
+        """Index code of a single case, in plain integers."""
+        return sum(int(positions[name]) * stride for (name, _), stride in zip(self.keys, self.strides))
+
+    def lookup(self, codes):
+        """Number of the rule that fires for each code."""
+        return self.index[codes]
+
+    def explain(self, code):
+        """The rule that fires for a single case code."""
+        return self.rules[int(self.index[code])]
+
+
+FINAL_CONCLUSION_TABLE = DecisionTable(KEYS, FINAL_CONCLUSION_RULES)
+
+
+def _number(value):
+    return math.nan if value is None else float(value)
+
+
+def conclusion_code(size, mass_dev, history_cancer, macro_fat, fat_percent, non_contrast, venous, delayed,
+                    low_attenuation, all_phases, abs_washout, rel_washout, calcification):
+    """``conclusion_codes`` of a single case, without building numpy arrays.
+
+    ``low_attenuation`` is the case's derived flag (non-contrast or venous HU at
+    most 20), which the array version computes itself. Comparisons with a missing
+    (None or NaN) value are false, as in the array version, so both give the same
+    code.
+    """
+    size, fat_percent, non_contrast, venous, delayed, abs_washout, rel_washout = (
+        _number(value) for value in (size, fat_percent, non_contrast, venous, delayed, abs_washout, rel_washout)
+    )
+    return FINAL_CONCLUSION_TABLE.code(
+        size_band=SIZE_BANDS.index(size_band(size)),
+        mass_dev=MASS_DEV_OPTIONS.index(mass_dev) if mass_dev in MASS_DEV_OPTIONS else len(MASS_DEV_OPTIONS),
+        history_cancer=bool(history_cancer),
+        macro_fat=bool(macro_fat),
+        high_fat_percent=fat_percent > 24,
+        hematoma_pattern=venous - non_contrast < 20 and venous > 20,
+        low_attenuation=bool(low_attenuation),
+        calcification=bool(calcification),
+        all_phases=bool(all_phases),
+        weak_enhancement=venous - non_contrast < 20 or non_contrast <= 20,
+        washout_suspicious=(abs_washout == abs_washout and rel_washout == rel_washout and
+                            (abs_washout < 60 or rel_washout < 40)),
+        washout_benign=abs_washout > 60 and rel_washout > 40,
+    )
+
+
+def conclusion_codes(size, mass_dev, history_cancer, macro_fat, fat_percent, non_contrast, venous, delayed,
+                     all_phases, abs_washout, rel_washout, calcification):
+    """Encode cases for ``FINAL_CONCLUSION_TABLE``.
+
+    Accepts scalars or arrays (``conclusion_code`` is quicker for one case); numeric values may be None or NaN when missing.
+    ``all_phases`` tells whether non-contrast, venous and delayed HU were all given,
+    and the washouts are missing wherever they could not be computed.
+    """
+    size, fat_percent, non_contrast, venous, delayed, abs_washout, rel_washout = (
+        np.asarray(value, dtype=float)
+        for value in (size, fat_percent, non_contrast, venous, delayed, abs_washout, rel_washout)
+    )
+    mass_dev = np.asarray(mass_dev, dtype=object)
+    all_phases = np.asarray(all_phases, dtype=bool)
+    return FINAL_CONCLUSION_TABLE.encode(
+        size_band=size_band_codes(size),
+        mass_dev=np.select(
+            [mass_dev == option for option in MASS_DEV_OPTIONS], range(len(MASS_DEV_OPTIONS)),
+            default=len(MASS_DEV_OPTIONS),
+        ),
+        history_cancer=history_cancer,
+        macro_fat=macro_fat,
+        high_fat_percent=fat_percent > 24,
+        hematoma_pattern=(venous - non_contrast < 20) & (venous > 20),
+        low_attenuation=(non_contrast <= 20) | (venous <= 20),
+        calcification=calcification,
+        all_phases=all_phases,
+        weak_enhancement=(venous - non_contrast < 20) | (non_contrast <= 20),
+        washout_suspicious=~np.isnan(abs_washout) & ~np.isnan(rel_washout) & ((abs_washout < 60) | (rel_washout < 40)),
+        washout_benign=(abs_washout > 60) & (rel_washout > 40),
+    )
@@ -0,0 +1,303 @@
+"""Headless HTTP/JSON assessment service.
+
+An asyncio server answers ``POST /assess`` with the results and conclusion the
+app shows for a case. Requests are put on a bounded queue and a single batcher
+task scores whatever has accumulated with ``assess_cohort``, so concurrent
+requests share one vectorized evaluation. When the queue is full the service
+answers 503 with ``Retry-After`` instead of queueing without limit, or 413 to a
+request with more cases than the queue holds. Each connection is read one
+request at a time, so a client that sends faster than it reads responses is
+slowed down by TCP::
+
+    python -m adrenal.service --port 8500
+
+A case is a JSON object keyed by the columns of the app's report export, for
+example ``{"Mass Size (mm)": "25", "Non-contrast HU": 12, "Venous phase HU": 60,
+"History of Cancer": false, "Mass Development": "No prior scanning"}``. Values
+may be numbers, booleans for the checkboxes or the text typed on the form; other
+JSON values are answered with 400. The "... CT Used" flags default to whether
+the matching HU values are given. The body may also be a list of cases,
+answered with a list of results.
+
+``GET /health`` reports the queue length and ``GET /metrics`` the Prometheus
+text export of ``adrenal.metrics``.
+"""
+
+import argparse
+import asyncio
+import http
+import http.client
+import json
+import sys
+import traceback
+
+import numpy as np
+import pandas as pd
+
+from adrenal.batch import (
+    ABS_WASHOUT, AGE, BENIGN_REASONS, BILATERAL, CALCIFICATION, CAPTION, CHECKBOX_COLUMNS, COMPLEMENTARY_COMMENTS,
+    CONCLUSION_RULE, DELAYED_HU, FAT_PERCENT, FINAL_CONCLUSION, HETEROGENICITY, HISTORY_CANCER, MACRO_FAT,
+    MALIGNANT_REASONS, MASS_DEV, MASS_SIZE, MODALITY_INPUTS, NON_CONTRAST_HU, PROBABILITY_COMMENTS, REASON_REFERRAL,
+    REL_WASHOUT, SMALL_CAPTION_RESULT, USE_CE_CT, USE_DE_CT, USE_NC_CT, VENOUS_PHASE_HU, VIRTUAL_NC_HU,
+    assess_cohort,
+)
+from adrenal.metrics import METRICS
+
+INPUT_COLUMNS = [
+    AGE, MASS_SIZE, HISTORY_CANCER, REASON_REFERRAL, USE_NC_CT, USE_CE_CT, USE_DE_CT, NON_CONTRAST_HU,
+    VENOUS_PHASE_HU, DELAYED_HU, VIRTUAL_NC_HU, FAT_PERCENT, MASS_DEV, BILATERAL, HETEROGENICITY, MACRO_FAT,
+    CALCIFICATION,
+]
+
+# Response field -> scored column
+RESULT_FIELDS = {
+    "small_caption_result": SMALL_CAPTION_RESULT,
+    "abs_washout": ABS_WASHOUT,
+    "rel_washout": REL_WASHOUT,
+    "benign_reasons": BENIGN_REASONS,
+    "malignant_reasons": MALIGNANT_REASONS,
+    "complementary_comments": COMPLEMENTARY_COMMENTS,
+    "probability_comments": PROBABILITY_COMMENTS,
+    "macro_fat": MACRO_FAT,
+    "caption": CAPTION,
+    "final_conclusion": FINAL_CONCLUSION,
+    "conclusion_rule": CONCLUSION_RULE,
+}
+
+JSON = "application/json; charset=utf-8"
+PROMETHEUS_TEXT = "text/plain; version=0.0.4; charset=utf-8"
+
+MAX_BODY = 1 << 20
+
+
+class Overloaded(Exception):
+    """The request queue is full."""
+
+
+def _form_value(column, value):
+    """A JSON value as the form would hold it: a checkbox flag or the text typed in."""
+    if column in CHECKBOX_COLUMNS:
+        return value if isinstance(value, bool) else str(value or "").strip().lower() in ("true", "1", "yes")
+    return "" if value is None else str(value)
+
+
+def invalid_value(case):
+    """Column of the first value of a case dict that is not text, a number, a boolean or null."""
+    for column, value in case.items():
+        if not isinstance(value, (str, int, float, type(None))):
+            return column
+    return None
+
+
+def score_cases(cases):
+    """Assess a list of case dicts and return one result dict per case.
+
+    Values are turned into the form's text first, so a case gets the same
+    result whatever it is batched with.
+    """
+    rows = []
+    for case in cases:
+        row = {column: _form_value(column, case.get(column)) for column in INPUT_COLUMNS}
+        for flag, inputs in MODALITY_INPUTS.items():
+            if flag not in case:
+                row[flag] = any(row[name] != "" for name in inputs)
+        rows.append(row)
+    scored = assess_cohort(pd.DataFrame(rows, columns=INPUT_COLUMNS), explain=True, lists=True)
+
+    columns = {}
+    for field, column in RESULT_FIELDS.items():
+        values = scored[column].to_numpy()
+        if values.dtype.kind == "f":
+            values = np.where(np.isnan(values), None, values)
+        columns[field] = values.tolist()
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+class AssessmentService:
+    """Micro-batching assessment server.
+
+    ``max_batch`` caps the cases scored together, ``max_delay`` is how long (in
+    seconds) a lone request waits for others to join its batch, and ``max_queue``
+    bounds the cases waiting to be scored.
+    """
+
+    def __init__(self, max_batch=512, max_delay=0.001, max_queue=8192):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._batcher = None
+
+    async def assess(self, cases):
+        """Results of a list of cases, scored with whatever else is queued."""
+        loop = asyncio.get_running_loop()
+        if self._queue.qsize() + len(cases) > self._queue.maxsize:
+            raise Overloaded
+        futures = []
+        for case in cases:
+            future = loop.create_future()
+            self._queue.put_nowait((case, future))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            if self._queue.qsize() < self.max_batch - 1:
+                # Give concurrent requests a moment to join the batch
+                await asyncio.sleep(self.max_delay)
+            while len(items) < self.max_batch and not self._queue.empty():
+                items.append(self._queue.get_nowait())
+            try:
+                # Scoring runs off the event loop so requests keep being read meanwhile
+                results = await loop.run_in_executor(None, score_cases, [case for case, _ in items])
+            except Exception as error:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for (_, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def _route(self, method, path, body):
+        """Status, content type, body and extra headers of the response."""
+        if path == "/assess":
+            if method != "POST":
+                return 405, JSON, {"error": "use POST"}, {"Allow": "POST"}
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                return 400, JSON, {"error": "body is not valid JSON"}, {}
+            cases = payload if isinstance(payload, list) else [payload]
+            if not all(isinstance(case, dict) for case in cases):
+                return 400, JSON, {"error": "expected a case object or a list of case objects"}, {}
+            for case in cases:
+                column = invalid_value(case)
+                if column is not None:
+                    return 400, JSON, {"error": f"{column!r} must be text, a number, true, false or null"}, {}
+            if len(cases) > self._queue.maxsize:
+                return 413, JSON, {"error": f"more than {self._queue.maxsize} cases in one request"}, {}
+            try:
+                results = await self.assess(cases)
+            except Overloaded:
+                return 503, JSON, {"error": "too many queued cases"}, {"Retry-After": "1"}
+            return 200, JSON, results if isinstance(payload, list) else results[0], {}
+        if path == "/health" and method == "GET":
+            return 200, JSON, {"status": "ok", "queued": self._queue.qsize()}, {}
+        if path == "/metrics" and method == "GET":
+            return 200, PROMETHEUS_TEXT, METRICS.exposition(), {}
+        return 404, JSON, {"error": "not found"}, {}
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                length = headers.get("content-length") or "0"
+                length = int(length) if length.isdecimal() else None
+                if length is None:
+                    # The body cannot be told from the next request, so the connection is closed after answering
+                    response = 400, JSON, {"error": "Content-Length is not a non-negative integer"}, {}
+                    keep_alive = False
+                elif length > MAX_BODY:
+                    response = 413, JSON, {"error": "body too large"}, {}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    try:
+                        response = await self._route(method, target.split("?", 1)[0], body)
+                    except Exception:
+                        # Answer rather than drop the connection, and leave the trace in the server log
+                        traceback.print_exc()
+                        response = 500, JSON, {"error": "internal error"}, {}
+
+                status, content_type, content, extra = response
+                data = content.encode() if isinstance(content, str) else json.dumps(content, ensure_ascii=False).encode()
+                head = [
+                    f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}",
+                    f"Content-Type: {content_type}",
+                    f"Content-Length: {len(data)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                ] + [f"{name}: {value}" for name, value in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8500):
+        """Start the batcher and listen; returns the ``asyncio.Server``."""
+        self._batcher = asyncio.create_task(self._run_batches())
+        return await asyncio.start_server(self._handle, host, port)
+
+
+class AssessmentClient:
+    """Blocking client of a running service, reusing one keep-alive connection."""
+
+    def __init__(self, host="127.0.0.1", port=8500, timeout=30):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def assess(self, case):
+        """Result for a case dict, or a list of results for a list of cases."""
+        self.connection.request("POST", "/assess", json.dumps(case), {"Content-Type": "application/json"})
+        response = self.connection.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"assessment failed with {response.status}: {body.decode(errors='replace')}")
+        return json.loads(body)
+
+    def close(self):
+        self.connection.close()
+
+
+async def serve(host, port, **options):
+    service = AssessmentService(**options)
+    server = await service.start(host, port)
+    print(f"Serving assessments on http://{host}:{port}/assess", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m adrenal.service",
+        description="Serve the app's assessment as an HTTP/JSON endpoint.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8500, help="port to listen on (default: 8500)")
+    parser.add_argument("--max-batch", type=int, default=512, help="cases scored together at most (default: 512)")
+    parser.add_argument("--max-delay-ms", type=float, default=1.0, help="wait for a batch to fill (default: 1 ms)")
+    parser.add_argument("--max-queue", type=int, default=8192, help="queued cases before answering 503 (default: 8192)")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(
+            args.host, args.port,
+            max_batch=args.max_batch, max_delay=args.max_delay_ms / 1000, max_queue=args.max_queue,
+        ))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""SQLite case store behind the reading-room worklist.
+
+Every assessment is appended as one row with the form inputs, the derived values
+and the conclusion. Filtering and paging run in SQLite on indexed columns, and
+bulk exports stream rows from a cursor instead of loading them all.
+"""
+
+import contextlib
+import datetime
+import io
+import os
+import sqlite3
+import tempfile
+
+from adrenal.export import REPORT_COLUMNS, write_report_csv
+from adrenal.rules import size_band
+
+DEFAULT_PATH = os.environ.get("ADRENAL_CASE_DB", "adrenal_cases.db")
+
+# Report column -> store column
+REPORT_FIELDS = {
+    "Patient ID": "patient_id",
+    # Only in the lesion export; empty for cases assessed on the form
+    "Lesion": "lesion",
+    "Side": "side",
+    "Age": "age",
+    "Mass Size (mm)": "mass_size",
+    "History of Cancer": "history_cancer",
+    "Reason of Referral": "reason_referral",
+    "Non-contrast CT Used": "use_nc_ct",
+    "Contrast Enhanced CT Used": "use_ce_ct",
+    "Dual-energy CT Used": "use_de_ct",
+    "Non-contrast HU": "non_contrast_hu",
+    "Venous phase HU": "venous_phase_hu",
+    "Delayed HU": "delayed_hu",
+    "Virtual non-contrast HU": "virtual_nc_hu",
+    "Fat Percent (%)": "fat_percent",
+    "Absolute Washout (%)": "abs_washout",
+    "Relative Washout (%)": "rel_washout",
+    "Mass Development": "mass_dev",
+    "Bilateral Finding": "bilateral",
+    "Heterogenicity": "heterogenicity",
+    "Macroscopic Fat": "macro_fat",
+    "Cystic": "cystic",
+    "Calcification": "calcification",
+    "Additional Comments": "additional_comments",
+    "Small Caption Result": "small_caption_result",
+    "Final Conclusion": "final_conclusion",
+}
+
+BOOLEAN_FIELDS = {"history_cancer", "use_nc_ct", "use_ce_ct", "use_de_ct", "bilateral", "macro_fat", "cystic", "calcification"}
+REAL_FIELDS = {"size_mm", "abs_washout", "rel_washout"}
+
+# Stored next to the report columns
+EXTRA_FIELDS = ["assessed_at", "assessed_on", "size_mm", "size_band", "caption", "conclusion_rule",
+                "benign_reasons", "malignant_reasons"]
+
+EXPORT_COLUMNS = ["Case ID", "Assessed At", "Size Band", "Conclusion Rule", "Patient ID", "Lesion", "Side"] + [
+    column for column in REPORT_COLUMNS if column != "Patient ID"
+]
+
+COLUMN_TYPES = {
+    field: "INTEGER" if field in BOOLEAN_FIELDS else "REAL" if field in REAL_FIELDS else "TEXT"
+    for field in EXTRA_FIELDS + list(REPORT_FIELDS.values())
+}
+COLUMN_DEFINITIONS = ",\n    ".join(f"{field} {kind}" for field, kind in COLUMN_TYPES.items())
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY,
+    {COLUMN_DEFINITIONS}
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS cases_final_conclusion ON cases (final_conclusion);
+CREATE INDEX IF NOT EXISTS cases_assessed_on ON cases (assessed_on);
+CREATE INDEX IF NOT EXISTS cases_size_band ON cases (size_band);
+CREATE INDEX IF NOT EXISTS cases_reason_referral ON cases (reason_referral);
+CREATE INDEX IF NOT EXISTS cases_patient_id ON cases (patient_id);
+"""
+
+# Worklist filters -> store column
+FILTERS = {
+    "date": "assessed_on",
+    "conclusion": "final_conclusion",
+    "size_band": "size_band",
+    "reason_referral": "reason_referral",
+}
+
+
+def _joined(reasons):
+    """Reasons as stored: ``assess_cohort`` gives joined text or, with ``lists=True``, tuples."""
+    return reasons if isinstance(reasons, str) else ", ".join(reasons)
+
+
+@contextlib.contextmanager
+def connect(path):
+    """Connection to the store file, committed on success and always closed."""
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+class CaseStore:
+    """Append-only store of assessed cases in a SQLite file.
+
+    Each call opens its own connection, so one store can be shared by all app
+    sessions; WAL journaling lets the worklist read while a case is written.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Stores created before a column was added get it, empty for the cases already stored
+            present = {row["name"] for row in conn.execute("PRAGMA table_info(cases)")}
+            for field, kind in COLUMN_TYPES.items():
+                if field not in present:
+                    conn.execute(f"ALTER TABLE cases ADD COLUMN {field} {kind}")
+            conn.executescript(INDEXES)
+
+    def _connect(self):
+        return connect(self.path)
+
+    def add(self, report, features, assessment, assessed_at=None):
+        """Store one assessment and return its case id.
+
+        ``report`` is the export row of the case, ``features`` and ``assessment``
+        the ``CaseFeatures`` and ``Assessment`` it was built from.
+        """
+        assessed_at = assessed_at or datetime.datetime.now()
+        row = {field: report.get(column) for column, field in REPORT_FIELDS.items()}
+        row["final_conclusion"] = assessment.final_conclusion
+        row["small_caption_result"] = assessment.small_caption_result
+        row.update(
+            assessed_at=assessed_at.isoformat(timespec="seconds"),
+            assessed_on=assessed_at.date().isoformat(),
+            size_mm=features.size,
+            size_band=size_band(features.size),
+            caption=assessment.caption,
+            conclusion_rule=assessment.conclusion_rule,
+            benign_reasons=", ".join(assessment.benign_reasons),
+            malignant_reasons=", ".join(assessment.malignant_reasons),
+        )
+        columns = ", ".join(row)
+        placeholders = ", ".join(f":{field}" for field in row)
+        with self._connect() as conn:
+            cursor = conn.execute(f"INSERT INTO cases ({columns}) VALUES ({placeholders})", row)
+            return cursor.lastrowid
+
+    def add_scored(self, scored, assessed_at=None):
+        """Store every case of an ``assess_cohort(..., explain=True)`` result.
+
+        Cases are inserted in one transaction; returns how many were stored.
+        """
+        from adrenal.batch import BENIGN_REASONS, CAPTION, CONCLUSION_RULE, MALIGNANT_REASONS, cohort_features
+
+        assessed_at = assessed_at or datetime.datetime.now()
+        sizes = cohort_features(scored)["size"].tolist()
+        rows = []
+        for case, size in zip(scored.to_dict("records"), sizes):
+            row = {}
+            for column, field in REPORT_FIELDS.items():
+                value = case.get(column)
+                if isinstance(value, float) and value != value:
+                    value = None
+                elif field in BOOLEAN_FIELDS and not isinstance(value, bool):
+                    value = str(value).strip().lower() in ("true", "1", "yes")
+                row[field] = value
+            size = None if size != size else size
+            row.update(
+                assessed_at=assessed_at.isoformat(timespec="seconds"),
+                assessed_on=assessed_at.date().isoformat(),
+                size_mm=size,
+                size_band=size_band(size),
+                caption=case[CAPTION],
+                conclusion_rule=case[CONCLUSION_RULE],
+                benign_reasons=_joined(case[BENIGN_REASONS]),
+                malignant_reasons=_joined(case[MALIGNANT_REASONS]),
+            )
+            rows.append(row)
+        if not rows:
+            return 0
+        columns = ", ".join(rows[0])
+        placeholders = ", ".join(f":{field}" for field in rows[0])
+        with self._connect() as conn:
+            conn.executemany(f"INSERT INTO cases ({columns}) VALUES ({placeholders})", rows)
+        return len(rows)
+
+    def _where(self, filters):
+        clauses, params = [], []
+        for name, value in filters.items():
+            if value is None:
+                continue
+            clauses.append(f"{FILTERS[name]} = ?")
+            params.append(value.isoformat() if isinstance(value, datetime.date) else value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def count(self, **filters):
+        """Number of stored cases matching the worklist filters."""
+        where, params = self._where(filters)
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM cases{where}", params).fetchone()[0]
+
+    def worklist(self, page=0, page_size=50, **filters):
+        """One page of matching cases, newest first, as a list of dicts.
+
+        Filters are ``date``, ``conclusion``, ``size_band`` and ``reason_referral``;
+        None matches every case, while "" only matches empty values.
+        """
+        where, params = self._where(filters)
+        query = f"SELECT * FROM cases{where} ORDER BY id DESC LIMIT ? OFFSET ?"
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(query, params + [page_size, page * page_size])]
+
+    def distinct(self, field):
+        """Values present in an indexed worklist column, for filter choices."""
+        column = FILTERS[field]
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(f"SELECT DISTINCT {column} FROM cases ORDER BY {column}")]
+
+    def iter_reports(self, batch_size=1000, **filters):
+        """Yield matching cases as export rows, fetching ``batch_size`` at a time."""
+        where, params = self._where(filters)
+        with self._connect() as conn:
+            cursor = conn.execute(f"SELECT * FROM cases{where} ORDER BY id", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    report = {
+                        column: bool(row[field]) if field in BOOLEAN_FIELDS and row[field] is not None else row[field]
+                        for column, field in REPORT_FIELDS.items()
+                    }
+                    report["Case ID"] = row["id"]
+                    report["Assessed At"] = row["assessed_at"]
+                    report["Size Band"] = row["size_band"]
+                    report["Conclusion Rule"] = row["conclusion_rule"]
+                    yield report
+
+    def write_csv(self, handle, **filters):
+        """Stream matching cases to a text handle in the report CSV layout."""
+        write_report_csv(handle, self.iter_reports(**filters), EXPORT_COLUMNS)
+
+    def csv_file(self, **filters):
+        """Matching cases as a CSV temporary file, rewound for reading.
+
+        Rows are spooled to disk as they are fetched, so exporting thousands of
+        cases never holds them all in memory.
+        """
+        handle = tempfile.TemporaryFile()
+        text = io.TextIOWrapper(handle, encoding="utf-8-sig", newline="")
+        self.write_csv(text, **filters)
+        text.flush()
+        text.detach()
+        handle.seek(0)
+        return handle
@@ -0,0 +1,165 @@
+"""What-if sweep of the conclusion column over a grid of size and HU values.
+
+``ConclusionSweep`` evaluates the caption and the final-conclusion rule of every
+point of a dense size x non-contrast x venous x delayed grid for one clinical
+context. The decision-table code of a case is a sum of per-key terms, so it
+splits into a part that depends only on the size and the context and a part
+that depends only on the three HU values. Both parts are computed on their own
+axes, cached separately and broadcast together, so a rerun that changes the
+context reuses the HU part and a rerun that only moves the displayed slice is
+served entirely from the cache.
+
+The referral reason, bilaterality and heterogeneity do not change the caption or
+the rule that fires, so they are not part of the sweep context.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from adrenal.cache import LRUCache
+from adrenal.rules import FINAL_CONCLUSION_TABLE, KEYS, MASS_DEV_OPTIONS, size_band_codes
+
+AXES = ["size", "non_contrast", "venous", "delayed"]
+
+AXIS_LABELS = {
+    "size": "Mass size (mm)",
+    "non_contrast": "Non-contrast HU",
+    "venous": "Venous phase HU",
+    "delayed": "Delayed HU",
+}
+
+CAPTIONS = ["", "Benign", "Probably benign", "Possibly malignant", "Probably malignant"]
+
+
+class Axis(namedtuple("Axis", ["start", "stop", "num"])):
+    """Evenly spaced values of one grid axis, both ends included."""
+
+    @property
+    def values(self):
+        return np.linspace(self.start, self.stop, self.num)
+
+
+Grid = namedtuple("Grid", AXES)
+Grid.__doc__ = "``Axis`` of each swept input."
+
+DEFAULT_GRID = Grid(
+    size=Axis(1, 80, 80),
+    non_contrast=Axis(-20, 80, 26),
+    venous=Axis(-20, 200, 23),
+    delayed=Axis(-20, 200, 23),
+)
+
+SweepContext = namedtuple("SweepContext", ["history_cancer", "mass_dev", "macro_fat", "calcification", "fat_percent"])
+SweepContext.__doc__ = "Inputs held fixed over the grid; ``fat_percent`` may be None."
+
+SweepResult = namedtuple("SweepResult", ["grid", "context", "rules", "captions"])
+SweepResult.__doc__ = """Evaluated grid.
+
+``rules`` holds the number of the firing ``FINAL_CONCLUSION_RULES`` row and
+``captions`` the index into ``CAPTIONS``, both shaped like the grid.
+"""
+
+_NO_POSITIONS = {name: 0 for name, _ in KEYS}
+
+
+def _size_codes(grid, context):
+    """Table code terms of the size axis and the context, shape (size,)."""
+    size = grid.size.values
+    fat_percent = np.nan if context.fat_percent is None else context.fat_percent
+    mass_dev = MASS_DEV_OPTIONS.index(context.mass_dev) if context.mass_dev in MASS_DEV_OPTIONS else len(MASS_DEV_OPTIONS)
+    return FINAL_CONCLUSION_TABLE.encode(**dict(
+        _NO_POSITIONS,
+        size_band=size_band_codes(size),
+        mass_dev=mass_dev,
+        history_cancer=context.history_cancer,
+        high_fat_percent=fat_percent > 24,
+        calcification=context.calcification,
+    ))
+
+
+def _hu_codes(grid, macro_fat):
+    """Table code terms of the HU axes, shape (non_contrast, venous, delayed)."""
+    nc = grid.non_contrast.values[:, None, None]
+    venous = grid.venous.values[None, :, None]
+    delayed = grid.delayed.values[None, None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        abs_washout = np.where(venous - nc != 0, (venous - delayed) / (venous - nc) * 100, np.nan)
+        rel_washout = np.where((venous - nc != 0) & (venous != 0), (venous - delayed) / venous * 100, np.nan)
+    washout = ~np.isnan(abs_washout) & ~np.isnan(rel_washout)
+    return FINAL_CONCLUSION_TABLE.encode(**dict(
+        _NO_POSITIONS,
+        # Negative HU forces macroscopic fat, as on the form
+        macro_fat=np.broadcast_to(macro_fat | (nc < 0) | (venous < 0), abs_washout.shape),
+        hematoma_pattern=(venous - nc < 20) & (venous > 20),
+        low_attenuation=(nc <= 20) | (venous <= 20),
+        all_phases=True,
+        weak_enhancement=(venous - nc < 20) | (nc <= 20),
+        washout_suspicious=washout & ((abs_washout < 60) | (rel_washout < 40)),
+        washout_benign=(abs_washout > 60) & (rel_washout > 40),
+    ))
+
+
+def _captions(grid):
+    """Caption index of every (size, non_contrast, venous) point."""
+    size = grid.size.values[:, None, None]
+    nc = grid.non_contrast.values[None, :, None]
+    venous = grid.venous.values[None, None, :]
+    low_hu = (nc < 10) | (venous < 10)
+    return np.select(
+        [
+            low_hu & (size < 10),
+            low_hu | (size < 10),
+            ((nc < 20) | (venous < 20)) & (size < 20),
+            ((nc < 40) | (venous < 40)) & (size < 40),
+            (((nc > 40) | (venous > 40)) & (venous - nc > 10)) | (size > 34),
+        ],
+        [1, 2, 2, 3, 4],
+        default=0,
+    ).astype(np.int8)
+
+
+class ConclusionSweep:
+    """Evaluates grids and keeps recent results and their parts in LRU caches."""
+
+    def __init__(self, maxsize=8):
+        self._sizes = LRUCache(maxsize)
+        self._hus = LRUCache(maxsize)
+        self._captions = LRUCache(maxsize)
+        self._results = LRUCache(maxsize)
+
+    def evaluate(self, grid, context):
+        """``SweepResult`` of ``grid`` (a ``Grid`` of ``Axis``) under ``context``."""
+        return self._results.get_or_compute((grid, context), self._evaluate)
+
+    def _evaluate(self, key):
+        grid, context = key
+        size_codes = self._sizes.get_or_compute((grid.size, context), lambda _: _size_codes(grid, context))
+        hu_grid = (grid.non_contrast, grid.venous, grid.delayed, context.macro_fat)
+        hu_codes = self._hus.get_or_compute(hu_grid, lambda _: _hu_codes(grid, context.macro_fat))
+        caption_grid = (grid.size, grid.non_contrast, grid.venous)
+        captions = self._captions.get_or_compute(caption_grid, lambda _: _captions(grid))
+
+        rules = FINAL_CONCLUSION_TABLE.lookup(size_codes[:, None, None, None] + hu_codes[None])
+        captions = np.broadcast_to(captions[..., None], rules.shape)
+        return SweepResult(grid, context, rules, captions)
+
+
+def grid_slice(result, x, y, **fixed):
+    """2-D slice of a ``SweepResult`` for a heatmap.
+
+    ``x`` and ``y`` name the plotted axes; ``fixed`` gives the value of each
+    remaining axis, and the nearest grid value is used. Returns
+    ``(x_values, y_values, rules, captions)`` with the arrays indexed [y, x].
+    """
+    index = []
+    for name in AXES:
+        if name in (x, y):
+            index.append(slice(None))
+        else:
+            index.append(int(np.abs(getattr(result.grid, name).values - fixed[name]).argmin()))
+    rules = result.rules[tuple(index)]
+    captions = result.captions[tuple(index)]
+    if AXES.index(x) < AXES.index(y):
+        rules, captions = rules.T, captions.T
+    return getattr(result.grid, x).values, getattr(result.grid, y).values, rules, captions
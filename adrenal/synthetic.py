@@ -0,0 +1,152 @@
+"""Synthetic cohorts in the layout of the app's report export.
+
+``synthetic_cohort`` draws cases that cover every size band (including the band
+edges), every HU range the rules distinguish (negative, low, hematoma and
+hypervascular values, equal phases that make the washout divide by zero),
+every "Mass development" value and every combination of the checkboxes. Cells
+are text, as when an export is read with ``dtype=str``, and occasionally empty
+or unparsable like real form input.
+"""
+
+import numpy as np
+import pandas as pd
+
+from adrenal.batch import (
+    ADDITIONAL_COMMENTS, AGE, BILATERAL, CALCIFICATION, CYSTIC, DELAYED_HU, FAT_PERCENT, FINAL_CONCLUSION,
+    HETEROGENICITY, HISTORY_CANCER, MACRO_FAT, MASS_DEV, MASS_SIZE, NON_CONTRAST_HU, REASON_REFERRAL,
+    SMALL_CAPTION_RESULT, USE_CE_CT, USE_DE_CT, USE_NC_CT, VENOUS_PHASE_HU, VIRTUAL_NC_HU,
+)
+from adrenal.export import REPORT_COLUMNS
+from adrenal.rules import MASS_DEV_OPTIONS
+
+REFERRAL_REASONS = ["Cancer work-up", "Hormonal imbalance", "Incidentaloma"]
+HETEROGENICITY_OPTIONS = ["", "Homogen", "Heterogen"]
+
+# Checkboxes of the form with how often each is ticked
+CHECKBOXES = {
+    HISTORY_CANCER: 0.3,
+    USE_NC_CT: 0.8,
+    USE_CE_CT: 0.6,
+    USE_DE_CT: 0.2,
+    BILATERAL: 0.1,
+    MACRO_FAT: 0.05,
+    CYSTIC: 0.1,
+    CALCIFICATION: 0.1,
+}
+MASS_DEV_WEIGHTS = [0.6, 0.1, 0.2, 0.1]
+
+# The first rows run through every checkbox combination with every mass development
+EXHAUSTIVE_ROWS = len(MASS_DEV_OPTIONS) << len(CHECKBOXES)
+
+# Size ranges in mm: up to 10, 10 to 20, 20 to 40 and 40 and above, edges included
+SIZE_RANGES = [(1, 10), (10, 20), (20, 40), (40, 120)]
+SIZE_EDGES = [10, 20, 40]
+
+# HU ranges the rules tell apart, with their weights
+HU_RANGES = [(-40, 0), (0, 10), (10, 20), (20, 40), (40, 120), (120, 200)]
+HU_WEIGHTS = [0.04, 0.16, 0.2, 0.25, 0.3, 0.05]
+
+MISSING_RATE = 0.03
+INVALID_RATE = 0.002
+
+
+def _numbers(rng, n, ranges, weights=None, decimals=0):
+    """Values drawn uniformly from a randomly chosen range of ``ranges``."""
+    bounds = np.array(ranges, dtype=float)[rng.choice(len(ranges), size=n, p=weights)]
+    values = rng.uniform(bounds[:, 0], bounds[:, 1])
+    return np.round(values, decimals) if decimals else np.round(values).astype(np.int64)
+
+
+def _text(rng, values, shown=None):
+    """Form text of numeric values, some left empty or mistyped."""
+    # Values repeat a lot, so each distinct one is formatted once
+    uniques, inverse = np.unique(values, return_inverse=True)
+    text = uniques.astype(str).astype(object)[inverse]
+    draw = rng.random(len(values))
+    text[draw < MISSING_RATE] = ""
+    text[(draw >= MISSING_RATE) & (draw < MISSING_RATE + INVALID_RATE)] = "n/a"
+    if shown is not None:
+        # Inputs of unticked modalities are not shown and export as empty cells
+        text[~shown] = ""
+    return text
+
+
+def synthetic_cohort(n, seed=0):
+    """DataFrame of ``n`` synthetic cases with the ``REPORT_COLUMNS`` columns."""
+    rng = np.random.default_rng(seed)
+    index = np.arange(n)
+    exhaustive = index < EXHAUSTIVE_ROWS
+
+    checked = {}
+    for bit, (column, rate) in enumerate(CHECKBOXES.items()):
+        checked[column] = np.where(exhaustive, index >> bit & 1, rng.random(n) < rate).astype(bool)
+    mass_dev = np.where(
+        exhaustive, index >> len(CHECKBOXES) & 3, rng.choice(len(MASS_DEV_OPTIONS), size=n, p=MASS_DEV_WEIGHTS),
+    )
+
+    size = _numbers(rng, n, SIZE_RANGES, decimals=1)
+    on_edge = rng.random(n) < 0.05
+    size[on_edge] = rng.choice(SIZE_EDGES, size=on_edge.sum())
+
+    non_contrast = _numbers(rng, n, HU_RANGES, HU_WEIGHTS)
+    venous = np.maximum(non_contrast + _numbers(rng, n, [(-10, 10), (10, 40), (40, 120)], [0.4, 0.3, 0.3]), -40)
+    # Contrast washes out of most masses by the delayed phase
+    delayed = np.round(venous * rng.uniform(0.2, 1.1, size=n)).astype(np.int64)
+    draw = rng.random(n)
+    # Equal phases or a zero venous HU make the washout divide by zero
+    venous[draw < 0.02] = non_contrast[draw < 0.02]
+    venous[(draw >= 0.02) & (draw < 0.03)] = 0
+    # Similar phases above 20 HU form the hematoma pattern
+    hematoma = (draw >= 0.03) & (draw < 0.05)
+    non_contrast[hematoma] = rng.integers(25, 80, size=hematoma.sum())
+    venous[hematoma] = non_contrast[hematoma] + rng.integers(-5, 6, size=hematoma.sum())
+    delayed[hematoma] = non_contrast[hematoma] + rng.integers(-5, 6, size=hematoma.sum())
+
+    cohort = {
+        AGE: _text(rng, rng.integers(1, 95, size=n)),
+        MASS_SIZE: _text(rng, size),
+        REASON_REFERRAL: rng.choice(REFERRAL_REASONS, size=n).astype(object),
+        NON_CONTRAST_HU: _text(rng, non_contrast, checked[USE_NC_CT]),
+        VENOUS_PHASE_HU: _text(rng, venous, checked[USE_CE_CT]),
+        DELAYED_HU: _text(rng, delayed, checked[USE_CE_CT]),
+        VIRTUAL_NC_HU: _text(rng, rng.integers(-20, 60, size=n), checked[USE_DE_CT]),
+        FAT_PERCENT: _text(rng, _numbers(rng, n, [(0, 24), (24, 60)], [0.8, 0.2], decimals=1), checked[USE_DE_CT]),
+        MASS_DEV: np.array(MASS_DEV_OPTIONS, dtype=object)[mass_dev],
+        HETEROGENICITY: rng.choice(HETEROGENICITY_OPTIONS, size=n).astype(object),
+        ADDITIONAL_COMMENTS: np.full(n, "", dtype=object),
+        SMALL_CAPTION_RESULT: np.full(n, "", dtype=object),
+        FINAL_CONCLUSION: np.full(n, "", dtype=object),
+    }
+    for column, values in checked.items():
+        cohort[column] = np.where(values, "True", "False").astype(object)
+    return pd.DataFrame(cohort, columns=[column for column in REPORT_COLUMNS if column in cohort])
+
+
+def form_inputs(row):
+    """Arguments of ``CaseFeatures.from_form`` for a row of a synthetic cohort.
+
+    Like the form, inputs of unticked modalities are empty and a negative HU
+    forces the macroscopic fat checkbox.
+    """
+    non_contrast = row[NON_CONTRAST_HU]
+    venous = row[VENOUS_PHASE_HU]
+    macro_fat = row[MACRO_FAT] == "True"
+    try:
+        macro_fat = macro_fat or bool(non_contrast and float(non_contrast) < 0) or bool(venous and float(venous) < 0)
+    except ValueError:
+        pass
+    return dict(
+        age=row[AGE],
+        mass_size=row[MASS_SIZE],
+        history_cancer=row[HISTORY_CANCER] == "True",
+        reason_referral=row[REASON_REFERRAL],
+        non_contrast_hu=non_contrast,
+        venous_phase_hu=venous,
+        delayed_hu=row[DELAYED_HU],
+        fat_percent=row[FAT_PERCENT],
+        mass_dev=row[MASS_DEV],
+        bilateral=row[BILATERAL] == "True",
+        heterogenicity=row[HETEROGENICITY],
+        macro_fat=macro_fat,
+        calcification=row[CALCIFICATION] == "True",
+    )
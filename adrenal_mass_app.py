@@ -1,392 +1,696 @@
+import datetime
+import os
+import time
+from functools import partial
+
+import numpy as np
 import streamlit as st
-import pandas as pd
 
-# Set page configuration
-st.set_page_config(
-    page_title="Adrenal Mass Approach",
-    page_icon="🯪",
-    layout="wide"
-)
+from adrenal.assessment import assessment_from, evaluate
+from adrenal.cache import LRUCache
+from adrenal.export import parquet_available, report_csv, report_parquet
+from adrenal.features import CaseFeatures
+from adrenal.growth import GrowthStore, is_measured
+from adrenal.metrics import METRICS, quantile
+from adrenal.rules import FINAL_CONCLUSION_RULES, MASS_DEV_OPTIONS, SIZE_BANDS
+from adrenal.store import CaseStore
+from adrenal.sweep import AXES, AXIS_LABELS, CAPTIONS, DEFAULT_GRID, ConclusionSweep, SweepContext, grid_slice
+
+REFERRAL_REASONS = ["Cancer work-up", "Hormonal imbalance", "Incidentaloma"]
+
+WORKLIST_PAGE_SIZE = 25
+COHORT_PREVIEW_ROWS = 100
+COHORT_MAX_SIZE = 200
+
+# Metrics are shared by every session of the server, so only an admin deployment may switch or reset them
+METRICS_ADMIN = os.environ.get("ADRENAL_ADMIN") == "1"
+
+WORKLIST_COLUMNS = [
+    "id", "assessed_at", "patient_id", "lesion", "side", "age", "mass_size", "size_band", "reason_referral", "caption",
+    "final_conclusion",
+]
+
+# Form widget key -> value when the widget is not shown
+FORM_DEFAULTS = {
+    "patient_id": "",
+    "age": "",
+    "mass_size": "",
+    "history_cancer": False,
+    "reason_referral": REFERRAL_REASONS[0],
+    "use_nc_ct": False,
+    "use_ce_ct": False,
+    "use_de_ct": False,
+    "non_contrast_hu": "",
+    "venous_phase_hu": "",
+    "delayed_hu": "",
+    "virtual_nc_hu": "",
+    "fat_percent": "",
+    "mass_dev": MASS_DEV_OPTIONS[0],
+    "bilateral": False,
+    "heterogenicity": "",
+    "macro_fat": False,
+    "cystic": False,
+    "calcification": False,
+    "additional_comments": "",
+}
+
+# Report export column -> form widget key
+REPORT_KEYS = {
+    "Patient ID": "patient_id",
+    "Age": "age",
+    "Mass Size (mm)": "mass_size",
+    "History of Cancer": "history_cancer",
+    "Reason of Referral": "reason_referral",
+    "Non-contrast CT Used": "use_nc_ct",
+    "Contrast Enhanced CT Used": "use_ce_ct",
+    "Dual-energy CT Used": "use_de_ct",
+    "Non-contrast HU": "non_contrast_hu",
+    "Venous phase HU": "venous_phase_hu",
+    "Delayed HU": "delayed_hu",
+    "Virtual non-contrast HU": "virtual_nc_hu",
+    "Fat Percent (%)": "fat_percent",
+    "Mass Development": "mass_dev",
+    "Bilateral Finding": "bilateral",
+    "Heterogenicity": "heterogenicity",
+    "Macroscopic Fat": "macro_fat",
+    "Cystic": "cystic",
+    "Calcification": "calcification",
+    "Additional Comments": "additional_comments",
+}
+
+# Panel fragment -> assessment graph values it shows. "Assess" reruns the panels
+# whose values changed, the export and the worklist; the form is left alone.
+PANEL_VALUES = {
+    "results": ("derived", "benign_reasons", "malignant_reasons", "complementary_comments", "probability_comments"),
+    "conclusion": ("caption", "final_conclusion"),
+}
+
+# Shown above results that were assessed for other values than the form now holds
+NOT_REASSESSED = ':orange[Not reassessed: the form has changed since. Press "Assess" to update.]'
+
+CAPTION_COLORS = {
+    "Benign": "green",
+    "Probably benign": "green",
+    "Possibly malignant": "red",
+    "Probably malignant": "red",
+}
+
+
+@st.cache_resource
+def assessment_cache():
+    # One cache for all sessions, so repeated consultations are served from memory
+    cache = LRUCache(maxsize=4096)
+    METRICS.watch("adrenal_assessment_cache_hits_total", lambda: cache.stats().hits, "counter")
+    METRICS.watch("adrenal_assessment_cache_misses_total", lambda: cache.stats().misses, "counter")
+    METRICS.watch("adrenal_assessment_cache_entries", lambda: cache.stats().size)
+    return cache
+
+
+@st.cache_resource
+def case_store():
+    return CaseStore()
+
+
+@st.cache_resource
+def growth_store():
+    return GrowthStore()
+
+
+@st.cache_resource
+def conclusion_sweep():
+    # Shared so unchanged grids and grid parts are reused across reruns and sessions
+    return ConclusionSweep()
+
+
+def evaluate_case(features, previous=None):
+    """``evaluate`` values, timed when metrics are recorded."""
+    if not METRICS.enabled:
+        return evaluate(features, previous).values
+    started = time.perf_counter()
+    values = evaluate(features, previous).values
+    METRICS.observe("adrenal_assess_seconds", time.perf_counter() - started)
+    return values
+
+
+def is_macro_fat_forced(use_nc_ct, non_contrast_hu, use_ce_ct, venous_phase_hu):
+    """Whether a negative HU value sets the macroscopic fat checkbox."""
+    try:
+        return bool(
+            (use_nc_ct and non_contrast_hu and float(non_contrast_hu) < 0) or
+            (use_ce_ct and venous_phase_hu and float(venous_phase_hu) < 0)
+        )
+    except ValueError:
+        return False
 
-# Title and credits
-st.title("Adrenal Mass Approach")
-st.caption("This app was developed by Peter Sommer Ulriksen and Reza Piri from Radiology Department in Rigshospitalet")
 
-# Create three columns
-col1, col2, col3 = st.columns(3)
+def patient_growth(patient_id, mass_size):
+    """``Growth`` of the patient's prior scans and today's size, None without a patient ID."""
+    if not patient_id:
+        return None
+    try:
+        current_size = float(mass_size)
+    except ValueError:
+        current_size = None
+    if not is_measured(current_size):
+        current_size = None
+    return growth_store().growth(patient_id, datetime.date.today(), current_size)
+
+
+def form_values():
+    """Values of the form as they are assessed.
+
+    Inputs of unticked modalities are empty, a negative HU sets macroscopic fat
+    and the mass development of a patient with prior scans is computed from them.
+    """
+    from adrenal.batch import MODALITY_INPUTS
+
+    values = {key: st.session_state.get(key, default) for key, default in FORM_DEFAULTS.items()}
+    values["patient_id"] = values["patient_id"].strip()
+    for modality, inputs in MODALITY_INPUTS.items():
+        if not values[REPORT_KEYS[modality]]:
+            values.update(dict.fromkeys((REPORT_KEYS[column] for column in inputs), ""))
+    values["macro_fat_forced"] = is_macro_fat_forced(
+        values["use_nc_ct"], values["non_contrast_hu"], values["use_ce_ct"], values["venous_phase_hu"],
+    )
+    values["macro_fat"] = values["macro_fat"] or values["macro_fat_forced"]
+    growth = patient_growth(values["patient_id"], values["mass_size"])
+    if growth is not None and growth.n >= 2:
+        values["mass_dev"] = growth.category
+    return values
+
+
+def build_report(values, assessment=None):
+    """Report export row of the form values and their assessment."""
+    report = {column: values[key] for column, key in REPORT_KEYS.items()}
+    report.update({
+        "Absolute Washout (%)": assessment.derived.abs_washout if assessment else None,
+        "Relative Washout (%)": assessment.derived.rel_washout if assessment else None,
+        "Small Caption Result": assessment.small_caption_result if assessment else "",
+        "Final Conclusion": assessment.final_conclusion if assessment else "",
+    })
+    return report
+
+
+def sweep_context(values):
+    try:
+        fat_percent = float(values["fat_percent"]) if values["fat_percent"] else None
+    except ValueError:
+        fat_percent = None
+    return SweepContext(
+        values["history_cancer"], values["mass_dev"], values["macro_fat"] and not values["macro_fat_forced"],
+        values["calcification"], fat_percent,
+    )
 
-# Column 1: Input Data
-with col1:
+
+def results_stale():
+    """Whether the form differs from the values the shown results were assessed for."""
+    assessed = st.session_state.get("assessed")
+    return assessed is not None and form_values() != assessed
+
+
+def form_changed():
+    """Rerun the result panels along with the form when an edit makes them stale, or current again."""
+    stale = results_stale()
+    if stale != st.session_state.get("stale", False):
+        st.session_state["stale"] = stale
+        st.rerun(["inputs", "results", "conclusion"])
+
+
+def assess_form():
+    """Assess the form and rerun the panels showing something that changed."""
+    started = time.perf_counter()
+    values = form_values()
+    features = CaseFeatures.from_form(
+        values["age"], values["mass_size"], values["history_cancer"], values["reason_referral"],
+        values["non_contrast_hu"], values["venous_phase_hu"], values["delayed_hu"], values["fat_percent"],
+        values["mass_dev"], values["bilateral"], values["heterogenicity"], values["macro_fat"], values["calcification"],
+    )
+    # Rules whose inputs did not change since the last assessment keep their values
+    previous = st.session_state.get("evaluation")
+    evaluation = assessment_cache().get_or_compute(features, partial(evaluate_case, previous=previous))
+    assessment = assessment_from(evaluation)
+    report = build_report(values, assessment)
+    if METRICS.enabled:
+        METRICS.record_assessment(assessment)
+
+    case_store().add(report, features, assessment)
+    if values["patient_id"] and is_measured(features.size):
+        growth_store().add_scan(values["patient_id"], datetime.date.today(), features.size)
+
+    # Panels marked as not reassessed are redrawn even when their values are the same
+    stale = st.session_state.pop("stale", False)
+    panels = [
+        panel for panel, names in PANEL_VALUES.items()
+        if previous is None or stale or any(evaluation[name] != previous[name] for name in names)
+    ]
+    assessed = st.session_state.get("assessed")
+    if assessed is None or sweep_context(assessed) != sweep_context(values):
+        panels.append("sweep")
+    st.session_state.update(evaluation=evaluation, assessment=assessment, assessed=values, report=report)
+    if METRICS.enabled:
+        st.session_state["assess_started"] = started
+    st.rerun(panels + ["worklist", "report"])
+
+
+def toggle_metrics():
+    METRICS.enabled = not METRICS.enabled
+
+
+def labels_text(labels):
+    return ", ".join(f"{name}={value}" for name, value in labels)
+
+
+def region_chart(x, y, x_values, y_values, labels, title):
+    """Heatmap of the label of every grid point of a 2-D slice."""
+    # Only imported once the sweep is switched on, so the app starts without them
+    import altair as alt
+    import pandas as pd
+
+    x_step = x_values[1] - x_values[0] if len(x_values) > 1 else 1
+    y_step = y_values[1] - y_values[0] if len(y_values) > 1 else 1
+    xs, ys = (values.ravel() for values in np.meshgrid(x_values, y_values))
+    data = pd.DataFrame({
+        "x": xs - x_step / 2, "x2": xs + x_step / 2,
+        "y": ys - y_step / 2, "y2": ys + y_step / 2,
+        title: labels.ravel(),
+    })
+    return alt.Chart(data, title=title).mark_rect().encode(
+        x=alt.X("x:Q", title=AXIS_LABELS[x]), x2="x2",
+        y=alt.Y("y:Q", title=AXIS_LABELS[y]), y2="y2",
+        color=alt.Color(f"{title}:N", scale=alt.Scale(scheme="tableau20"), legend=alt.Legend(orient="bottom", columns=2)),
+        tooltip=[f"{title}:N"],
+    )
+
+
+@st.fragment(key="inputs")
+def input_panel():
+    # Editing the form only reruns this fragment; "Assess" reruns the panels it changes
     st.header("Input Data")
-    age = st.text_input("Age")
-    mass_size = st.text_input("Mass size in mm (short axis)")
-    history_cancer = st.checkbox("History of cancer")
+    patient_id = st.text_input("Patient ID", key="patient_id", on_change=form_changed).strip()
+    st.text_input("Age", key="age", on_change=form_changed)
+    mass_size = st.text_input("Mass size in mm (short axis)", key="mass_size", on_change=form_changed)
+    st.checkbox("History of cancer", key="history_cancer", on_change=form_changed)
 
-    reason_referral = st.selectbox(
+    st.selectbox(
         "Reason of referral",
-        ["Cancer work-up", "Hormonal imbalance", "Incidentaloma"]
+        REFERRAL_REASONS,
+        key="reason_referral",
+        on_change=form_changed,
     )
 
     st.markdown("---")
     st.subheader("Modality used")
-    use_nc_ct = st.checkbox("Non-contrast CT")
-    use_ce_ct = st.checkbox("Contrast enhanced CT")
-    use_de_ct = st.checkbox("Dual-energy CT")
+    use_nc_ct = st.checkbox("Non-contrast CT", key="use_nc_ct", on_change=form_changed)
+    use_ce_ct = st.checkbox("Contrast enhanced CT", key="use_ce_ct", on_change=form_changed)
+    use_de_ct = st.checkbox("Dual-energy CT", key="use_de_ct", on_change=form_changed)
 
-    non_contrast_hu = venous_phase_hu = delayed_hu = virtual_nc_hu = fat_percent = ""
+    non_contrast_hu = venous_phase_hu = ""
 
     if use_nc_ct:
-        non_contrast_hu = st.text_input("Non-contrast HU")
+        non_contrast_hu = st.text_input("Non-contrast HU", key="non_contrast_hu", on_change=form_changed)
     if use_ce_ct:
-        venous_phase_hu = st.text_input("Venous phase HU")
-        delayed_hu = st.text_input("Delayed HU")
+        venous_phase_hu = st.text_input("Venous phase HU", key="venous_phase_hu", on_change=form_changed)
+        st.text_input("Delayed HU", key="delayed_hu", on_change=form_changed)
     if use_de_ct:
-        virtual_nc_hu = st.text_input("Virtual non-contrast HU")
-        fat_percent = st.text_input("Fat percent (%)")
+        st.text_input("Virtual non-contrast HU", key="virtual_nc_hu", on_change=form_changed)
+        st.text_input("Fat percent (%)", key="fat_percent", on_change=form_changed)
 
     st.markdown("---")
     st.subheader("Radiologic Features")
 
-    mass_dev = st.selectbox(
-        "Mass development",
-        ["No prior scanning", "Increased >5 mm/year", "Increased <5 mm/year", "In doubt"]
-    )
-    bilateral = st.checkbox("Bilateral finding")
-    heterogenicity = st.selectbox("Heterogenicity", ["", "Homogen", "Heterogen"])
-
-    macro_fat_forced = False
-    try:
-        if (use_nc_ct and non_contrast_hu and float(non_contrast_hu) < 0) or (use_ce_ct and venous_phase_hu and float(venous_phase_hu) < 0):
-            macro_fat_forced = True
-    except ValueError:
-        pass
+    # With prior scans of the patient on file, the growth category is computed from them
+    if patient_id:
+        today = datetime.date.today()
+        with st.expander("Prior scans"):
+            scan_date = st.date_input("Scan date", value=None, max_value=today)
+            scan_size = st.number_input("Size in mm", min_value=0.0, value=None)
+            if st.button("Add prior scan") and scan_date is not None and is_measured(scan_size):
+                growth_store().add_scan(patient_id, scan_date, scan_size)
+            scans_file = st.file_uploader("Import scans (CSV: patient_id;scan_date;size_mm)", type="csv")
+            if scans_file is not None and st.button("Import"):
+                imported, skipped = growth_store().import_csv(scans_file.getvalue().decode("utf-8"))
+                st.caption(f"Imported {imported} scans.")
+                if skipped:
+                    st.warning(f"Skipped {skipped} rows without a patient id, an ISO date (YYYY-MM-DD) or a positive size.")
+            history = growth_store().history(patient_id)
+            if history:
+                st.dataframe(
+                    [{"Scan date": scanned_on, "Size (mm)": size} for scanned_on, size in history],
+                    hide_index=True,
+                )
+
+    growth = patient_growth(patient_id, mass_size)
+    if growth is not None and growth.n >= 2:
+        st.selectbox("Mass development", [growth.category], disabled=True)
+        st.caption(f"Computed from {growth.n} scans: {growth.rate:.1f} mm/year.")
+    else:
+        st.selectbox("Mass development", MASS_DEV_OPTIONS, key="mass_dev", on_change=form_changed)
+    st.checkbox("Bilateral finding", key="bilateral", on_change=form_changed)
+    st.selectbox("Heterogenicity", ["", "Homogen", "Heterogen"], key="heterogenicity", on_change=form_changed)
 
-    if macro_fat_forced:
-        macro_fat = True
+    if is_macro_fat_forced(use_nc_ct, non_contrast_hu, use_ce_ct, venous_phase_hu):
         st.checkbox("Sign of macroscopic fat", value=True, disabled=True)
         st.caption("Detected negative HU value → macroscopic fat automatically set.")
     else:
-        macro_fat = st.checkbox("Sign of macroscopic fat")
+        st.checkbox("Sign of macroscopic fat", key="macro_fat", on_change=form_changed)
 
-    cystic = st.checkbox("Cystic")
-    calcification = st.checkbox("Calcification")
-    additional_comments = st.text_area("Additional Comments")
+    st.checkbox("Cystic", key="cystic", on_change=form_changed)
+    st.checkbox("Calcification", key="calcification", on_change=form_changed)
+    st.text_area("Additional Comments", key="additional_comments", on_change=form_changed)
     st.markdown("---")
-    assess_button = st.button("Assess")
-    small_caption_result = ""
+    st.button("Assess", on_click=assess_form)
 
-# Column 2: Assessment Results
-with col2:
+    # Changes without a callback, like added prior scans, can also leave the results stale
+    if results_stale() != st.session_state.get("stale", False):
+        st.session_state["stale"] = not st.session_state.get("stale", False)
+        st.rerun()
+
+
+@st.fragment(key="results")
+def results_panel():
     st.header("Assessment Results")
-    
-    if assess_button:
-        try:
-            size_value = float(mass_size) if mass_size else None
-            non_contrast_val = float(non_contrast_hu) if non_contrast_hu else None
-            venous_val = float(venous_phase_hu) if venous_phase_hu else None
-            delayed_val = float(delayed_hu) if delayed_hu else None
-            fat_percent_val = float(fat_percent) if fat_percent else None
-            age_val = int(age) if age else None
-        except:
-            size_value = non_contrast_val = venous_val = delayed_val = fat_percent_val = age_val = None
-
-        benign_reasons = []
-        malignant_reasons = []
-        complementary_comments = []
-        probability_comments = []
-
-        # Small caption logic
-        if ((non_contrast_val is not None and non_contrast_val < 10) or (venous_val is not None and venous_val < 10)) and (size_value is not None and size_value < 10):
-            small_caption_result = "Benign"
-        elif ((non_contrast_val is not None and non_contrast_val < 10) or (venous_val is not None and venous_val < 10)) or (size_value is not None and size_value < 10):
-            benign_reasons.append("no enhancement (HU change < 10)")
-
-        # Malignant features
-        if venous_val is not None and non_contrast_val is not None:
-            if venous_val - non_contrast_val > 20:
-                malignant_reasons.append("enhancement (HU change > 20)")
-        elif venous_val is not None and non_contrast_val is None:
-            if venous_val > 40:
-                malignant_reasons.append("HU venous > 40 (no non-contrast available)")
-        
-        if fat_percent_val is not None and fat_percent_val > 24:
-            benign_reasons.append("fat percent > 24% on DECT")
-            complementary_comments.append("High fat percentage on dual-energy CT is a benign feature.")
-
-        if bilateral:
-            malignant_reasons.append("bilateral finding")
-            complementary_comments.append("Due to bilateral findings, consider pheochromocytoma, bilateral macronodular hyperplasia, congenital adrenal hyperplasia, ACTH-dependent Cushing, lymphoma, infection, bleeding, metastasis, granulomatous disease or 21-hydroxylase deficiency.")
-        
-        if mass_dev == "Increased >5 mm/year":
-            malignant_reasons.append("growth > 5 mm/year")
-        
-        if venous_val is not None and non_contrast_val is not None:
-            if (venous_val > 20 or non_contrast_val > 20) and not (venous_val - non_contrast_val < 10 and venous_val > 20):
-                malignant_reasons.append("high HU >20 without hematoma pattern")
-        
-        if size_value is not None and size_value > 34:
-            malignant_reasons.append("size > 3.4 cm")
-        
-        if heterogenicity == "Heterogen":
-            malignant_reasons.append("heterogenicity")
-
-        # Washout calculations
-        if venous_val is not None and delayed_val is not None and non_contrast_val is not None:
-            try:
-                abs_washout = ((venous_val - delayed_val) / (venous_val - non_contrast_val)) * 100
-                rel_washout = ((venous_val - delayed_val) / venous_val) * 100
-
-                st.markdown(f"**Absolute washout**: {abs_washout:.1f}%")
-                st.markdown(f"**Relative washout**: {rel_washout:.1f}%")
-
-                if abs_washout < 60:
-                    malignant_reasons.append("absolute washout < 60%")
-                if rel_washout < 40:
-                    malignant_reasons.append("relative washout < 40%")
-
-            except ZeroDivisionError:
-                st.warning("Division by zero in washout calculation. Check HU values.")
-
-        # Complementary interpretations
-        if non_contrast_val is not None and non_contrast_val > 20:
-            complementary_comments.append("Due to HU > 20, check plasma metanephrines.")
-        
-        if heterogenicity == "Heterogen":
-            complementary_comments.append("Due to heterogenicity, check plasma metanephrines.")
-        
-        if venous_val is not None and venous_val > 120:
-            complementary_comments.append("HU venous > 120 – consider hypervascular tumors such as RCC, HCC, or pheochromocytoma.")
-        
-        if delayed_val is not None and delayed_val > 120:
-            complementary_comments.append("HU delayed > 120 – consider hypervascular tumors such as RCC, HCC, or pheochromocytoma.")
-        
-        if all(v is not None and v > 20 for v in [non_contrast_val, venous_val, delayed_val]) and \
-           abs(non_contrast_val - venous_val) < 6 and abs(non_contrast_val - delayed_val) < 6:
-            complementary_comments.append("Probably hematoma – no follow-up needed.")
-        
-        if size_value is not None and size_value < 50:
-            complementary_comments.append("Probability of adrenal carcinoma is very low due to size < 5 cm.")
-
-        # Probability comments
-        if reason_referral == "Cancer work-up":
-            probability_comments.append("The risk of malignancy because of the referral reason is 43%.")
-        elif reason_referral == "Hormonal imbalance":
-            probability_comments.append("The risk of malignancy because of the referral reason is 3%.")
-        elif reason_referral == "Incidentaloma":
-            probability_comments.append("The risk of malignancy because of the referral reason is 3%.")
-
-        if age_val is not None:
-            if age_val < 18:
-                probability_comments.append("Age-related risk of malignancy is 62%.")
-            elif 18 <= age_val <= 39:
-                probability_comments.append("Age-related risk of malignancy is 4%.")
-            elif 40 <= age_val <= 65:
-                probability_comments.append("Age-related risk of malignancy is 6%.")
-            elif age_val > 65:
-                probability_comments.append("Age-related risk of malignancy is 11%.")
-
-        if size_value is not None:
-            if size_value < 40:
-                probability_comments.append("Size-related risk of malignancy is 2%.")
-            elif 40 <= size_value <= 60:
-                probability_comments.append("Size-related risk of malignancy is 6%.")
-            elif size_value > 60:
-                probability_comments.append("Size-related risk of adrenal carcinoma is 25% and for metastasis is 18%.")
-
-        if benign_reasons:
-            reasons_text = ", ".join(benign_reasons)
+
+    assessment = st.session_state.get("assessment")
+    if assessment is not None:
+        if st.session_state.get("stale"):
+            st.caption(NOT_REASSESSED)
+        derived = assessment.derived
+        if derived.abs_washout is not None and derived.rel_washout is not None:
+            st.markdown(f"**Absolute washout**: {derived.abs_washout:.1f}%")
+            st.markdown(f"**Relative washout**: {derived.rel_washout:.1f}%")
+        if derived.washout_error:
+            st.warning("Division by zero in washout calculation. Check HU values.")
+
+        if assessment.benign_reasons:
+            reasons_text = ", ".join(assessment.benign_reasons)
             st.success(f"The following features suggest a probably benign etiology: {reasons_text}.")
 
-        if malignant_reasons:
-            reasons_text = ", ".join(malignant_reasons)
+        if assessment.malignant_reasons:
+            reasons_text = ", ".join(assessment.malignant_reasons)
             st.error(f"The following features suggest a probably malignant etiology: {reasons_text}.")
 
-        if complementary_comments:
+        if assessment.complementary_comments:
             st.markdown("### Complementary Interpretations")
-            for comment in complementary_comments:
+            for comment in assessment.complementary_comments:
                 st.write("- " + comment)
 
-        if probability_comments:
+        if assessment.probability_comments:
             st.markdown("### Probabilities")
-            for comment in probability_comments:
+            for comment in assessment.probability_comments:
                 st.write("- " + comment)
 
-        if not benign_reasons and not malignant_reasons:
+        if not assessment.benign_reasons and not assessment.malignant_reasons:
             st.info("No strong benign or malignant indicators found. Further evaluation may be needed.")
 
-# Column 3: Final Conclusion
-with col3:
-    st.header("Final Conclusion")
 
-    final_conclusion = ""
-
-    if assess_button:
-        try:
-            size_value = float(mass_size) if mass_size else None
-            non_contrast_val = float(non_contrast_hu) if non_contrast_hu else None
-            venous_val = float(venous_phase_hu) if venous_phase_hu else None
-            delayed_val = float(delayed_hu) if delayed_hu else None
-            age_val = int(age) if age else None
-        except:
-            size_value = non_contrast_val = venous_val = delayed_val = age_val = None
-
-        malignant_signs = []
-
-        if venous_val is not None and non_contrast_val is not None:
-            if venous_val - non_contrast_val > 10:
-                malignant_signs.append("enhancement >10 HU")
-        if venous_val is not None and non_contrast_val is None:
-            if venous_val > 40:
-                malignant_signs.append("venous HU >40 without non-contrast")
-        if bilateral:
-            malignant_signs.append("bilateral finding")
-        if mass_dev == "Increased >5 mm/year":
-            malignant_signs.append("growth >5 mm/year")
-        if size_value is not None and size_value > 40:
-            malignant_signs.append("size >4 cm")
-        if heterogenicity == "Heterogen":
-            malignant_signs.append("heterogenicity")
-        if venous_val and delayed_val and non_contrast_val:
-            try:
-                abs_washout = ((venous_val - delayed_val) / (venous_val - non_contrast_val)) * 100
-                rel_washout = ((venous_val - delayed_val) / venous_val) * 100
-                if abs_washout < 60:
-                    malignant_signs.append("absolute washout <60%")
-                if rel_washout < 40:
-                    malignant_signs.append("relative washout <40%")
-            except ZeroDivisionError:
-                pass
+@st.fragment(key="conclusion")
+def conclusion_panel():
+    st.header("Final Conclusion")
 
+    assessment = st.session_state.get("assessment")
+    if assessment is not None:
+        if st.session_state.get("stale"):
+            st.caption(NOT_REASSESSED)
         # Immediate small caption
-        if (
-            (non_contrast_val is not None and non_contrast_val < 10) or
-            (venous_val is not None and venous_val < 10)
-        ) and (size_value is not None and size_value < 10):
-            st.markdown("<p style='color:green;'>Benign</p>", unsafe_allow_html=True)
-        elif (
-            (non_contrast_val is not None and non_contrast_val < 10) or
-            (venous_val is not None and venous_val < 10)
-        ) or (size_value is not None and size_value < 10):
-            st.markdown("<p style='color:green;'>Probably benign</p>", unsafe_allow_html=True)
-        elif (
-            (non_contrast_val is not None and non_contrast_val < 20) or
-            (venous_val is not None and venous_val < 20)
-        ) and (size_value is not None and size_value < 20):
-            st.markdown("<p style='color:green;'>Probably benign</p>", unsafe_allow_html=True)
-        elif (
-            (non_contrast_val is not None and non_contrast_val < 40) or
-            (venous_val is not None and venous_val < 40)
-        ) and (size_value is not None and size_value < 40):
-            st.markdown("<p style='color:red;'>Possibly malignant</p>", unsafe_allow_html=True)
-        elif (
-            (
-                ((non_contrast_val is not None and non_contrast_val > 40) or
-                 (venous_val is not None and venous_val > 40)) and
-                (venous_val is not None and non_contrast_val is not None and venous_val - non_contrast_val > 10)
-            ) or
-            (size_value is not None and size_value > 34)
-        ):
-            st.markdown("<p style='color:red;'>Probably malignant</p>", unsafe_allow_html=True)
-
-        # Final Conclusion full rules
-        if size_value is not None and size_value >= 40:
-            low_attenuation_present = (
-                (non_contrast_val is not None and non_contrast_val <= 20) or
-                (venous_val is not None and venous_val <= 20)
-            )
-            if not macro_fat or not low_attenuation_present:
-                if history_cancer:
-                    final_conclusion = "Consider biopsy or PET-CT, also consider biochemical assays."
-                else:
-                    final_conclusion = "Consider Resection and biochemical assays."
-        elif macro_fat or (fat_percent_val is not None and fat_percent_val > 24):
-            final_conclusion = "The mass is probably a Myelolipoma. No follow-up needed."
-            if malignant_signs:
-                final_conclusion += f" But, due to the existence of {', '.join(malignant_signs)}, Consider biochemical assays to determine functional status."
-        elif non_contrast_val is not None and venous_val is not None and (venous_val - non_contrast_val < 20) and venous_val > 20:
-            final_conclusion = "There is a hematoma enhancement pattern. No follow-up needed."
-            if malignant_signs:
-                final_conclusion += f" But, due to the existence of {', '.join(malignant_signs)}, Consider biochemical assays to determine functional status."
-        elif (non_contrast_val is not None and non_contrast_val <= 20) or (venous_val is not None and venous_val <= 20):
-            final_conclusion = "Due to low attenuation, no follow-up needed."
-            if malignant_signs:
-                final_conclusion += f" But, due to the existence of {', '.join(malignant_signs)}, Consider biochemical assays to determine functional status."
-        elif calcification:
-            final_conclusion = "Calcification of the mass is a benign sign. No follow-up needed."
-            if malignant_signs:
-                final_conclusion += f" But, due to the existence of {', '.join(malignant_signs)}, Consider biochemical assays to determine functional status."
-        elif size_value is not None and size_value <= 10:
-            final_conclusion = "Due to small size, no follow-up needed."
-            if malignant_signs:
-                final_conclusion += f" But, due to the existence of {', '.join(malignant_signs)}, consider biochemical assays to determine functional status."
-        elif size_value is not None and 10 < size_value <= 20 and mass_dev == "No prior scanning" and not history_cancer:
-            final_conclusion = "Probably benign, but consider biochemical assays to determine functional status and consider adrenal CT scanning after 12 months."
-        elif size_value is not None and 10 < size_value <= 40 and mass_dev == "Increased <5 mm/year":
-            final_conclusion = "Probably benign, No follow-up needed."
-            if malignant_signs:
-                final_conclusion += f" But, due to the existence of {', '.join(malignant_signs)}, consider biochemical assays to determine functional status."
-        elif size_value is not None and 10 < size_value <= 40 and mass_dev in ["Increased >5 mm/year", "In doubt"] and not history_cancer:
-            if non_contrast_val is not None and venous_val is not None and delayed_val is not None:
-                if abs_washout is not None and rel_washout is not None and (abs_washout < 60 or rel_washout < 40):
-                    final_conclusion = "Depending on the clinical scenario, Control with Adrenal CT, biopsy, PET-CT or Resection should be considered, also consider biochemical assays."
-                else:
-                    final_conclusion = "Resection recommended. Consider biochemical assays and adrenal CT."
-            else:
-                final_conclusion = "Resection recommended. Consider biochemical assays and adrenal CT."
-        elif size_value is not None and 10 < size_value <= 40 and mass_dev in ["Increased >5 mm/year", "In doubt"] and history_cancer:
-            final_conclusion = "Consider biopsy or PET-CT, including biochemical assays."
-        elif size_value is not None and 20 < size_value < 40 and mass_dev == "No prior scanning" and not history_cancer:
-            if non_contrast_val is None or venous_val is None or delayed_val is None:
-                final_conclusion = "Consider Adrenal CT."
-            else:
-                if (venous_val - non_contrast_val < 20) or (non_contrast_val is not None and non_contrast_val <= 20):
-                    final_conclusion = "Probably benign. No follow-up needed."
-                elif abs_washout > 60 and rel_washout > 40:
-                    final_conclusion = "Probably benign, No follow-up needed, but biochemical assays to determine functional status can be considered."
-                else:
-                    final_conclusion = "Depending on the clinical scenario, control with adrenal CT, biopsy, PET-CT or resection should be considered, also consider biochemical assays."
-        elif size_value is not None and 10 < size_value < 40 and mass_dev == "No prior scanning" and history_cancer:
-            if non_contrast_val is None or venous_val is None or delayed_val is None:
-                final_conclusion = "Consider Adrenal CT."
-            else:
-                if (venous_val - non_contrast_val < 20) or (non_contrast_val is not None and non_contrast_val <= 20):
-                    final_conclusion = "Probably benign. No follow-up needed."
-                elif abs_washout > 60 and rel_washout > 40:
-                    final_conclusion = "Probably benign. No follow-up needed. Biochemical assays may be considered."
-                else:
-                    final_conclusion = "Depending on the clinical scenario, control with adrenal CT, biopsy, PET-CT or resection should be considered, also consider biochemical assays."
-
-    if final_conclusion:
-        st.markdown(f"<p style='color:black;'>{final_conclusion}</p>", unsafe_allow_html=True)
-        st.session_state['final_conclusion'] = final_conclusion
+        if assessment.caption:
+            st.markdown(f"<p style='color:{CAPTION_COLORS[assessment.caption]};'>{assessment.caption}</p>", unsafe_allow_html=True)
 
-# Export functionality
-df_export = pd.DataFrame({
-    "Age": [age],
-    "Mass Size (mm)": [mass_size],
-    "History of Cancer": [history_cancer],
-    "Reason of Referral": [reason_referral],
-    "Non-contrast CT Used": [use_nc_ct],
-    "Contrast Enhanced CT Used": [use_ce_ct],
-    "Non-contrast HU": [non_contrast_hu],
-    "Venous phase HU": [venous_phase_hu],
-    "Delayed HU": [delayed_hu],
-    "Mass Development": [mass_dev],
-    "Bilateral Finding": [bilateral],
-    "Heterogenicity": [heterogenicity],
-    "Macroscopic Fat": [macro_fat],
-    "Cystic": [cystic],
-    "Calcification": [calcification],
-    "Additional Comments": [additional_comments],
-    "Small Caption Result": [small_caption_result],
-    "Final Conclusion": [st.session_state.get('final_conclusion', "")]
-})
-
-csv = df_export.to_csv(index=False, sep=';', encoding='utf-8-sig').encode('utf-8-sig')
-
-st.download_button(
-    label="Save Report as CSV",
-    data=csv,
-    file_name='adrenal_mass_report.csv',
-    mime='text/csv',
+        if assessment.final_conclusion:
+            st.markdown(f"<p style='color:black;'>{assessment.final_conclusion}</p>", unsafe_allow_html=True)
+
+
+@st.fragment(key="report")
+def report_panel():
+    # The report of the last assessment, or of the form before anything is assessed
+    report = st.session_state.get("report") or build_report(form_values())
+
+    # The report is only serialized when a download is requested
+    st.download_button(
+        label="Save Report as CSV",
+        data=partial(report_csv, [report]),
+        file_name='adrenal_mass_report.csv',
+        mime='text/csv',
+        on_click="ignore",
+    )
+
+    if parquet_available():
+        st.download_button(
+            label="Save Report as Parquet",
+            data=partial(report_parquet, [report]),
+            file_name='adrenal_mass_report.parquet',
+            mime='application/vnd.apache.parquet',
+            on_click="ignore",
+        )
+
+    # "Assess" reruns this fragment last
+    started = st.session_state.pop("assess_started", None)
+    if started is not None and METRICS.enabled:
+        METRICS.observe("adrenal_rerun_seconds", time.perf_counter() - started, (("assess", "true"),))
+
+
+def lesion_editor():
+    """Columns, column configuration and empty table of the "Multiple lesions" editor."""
+    import pandas as pd
+
+    from adrenal.batch import CALCIFICATION, CHECKBOX_COLUMNS, CYSTIC, HETEROGENICITY, MACRO_FAT, MASS_DEV
+    from adrenal.lesions import LESION_COLUMNS, PATIENT_ID, SIDE, SIDES
+
+    columns = [PATIENT_ID] + LESION_COLUMNS
+    config = {
+        PATIENT_ID: st.column_config.TextColumn(help="Empty cells take the patient entered on the form"),
+        SIDE: st.column_config.SelectboxColumn(options=SIDES),
+        MASS_DEV: st.column_config.SelectboxColumn(options=MASS_DEV_OPTIONS, default=MASS_DEV_OPTIONS[0]),
+        HETEROGENICITY: st.column_config.SelectboxColumn(options=["", "Homogen", "Heterogen"]),
+        MACRO_FAT: st.column_config.CheckboxColumn(default=False),
+        CYSTIC: st.column_config.CheckboxColumn(default=False),
+        CALCIFICATION: st.column_config.CheckboxColumn(default=False),
+    }
+    empty = pd.DataFrame({
+        column: pd.Series(dtype=bool if column in CHECKBOX_COLUMNS else object) for column in columns
+    })
+    return columns, config, empty
+
+
+@st.fragment(key="lesions")
+def lesions_panel():
+    # All lesions in the table, of the form's patient or of every imported patient, are scored together.
+    # pandas and the lesion module are imported here rather than when the app is loaded.
+    from adrenal.batch import AGE, HISTORY_CANCER, REASON_REFERRAL
+    from adrenal.lesions import (
+        LESION_REPORT_COLUMNS, PATIENT_ID, assess_lesions, lesion_reports, lesion_results, lesion_table,
+        patient_summary, read_lesions,
+    )
+
+    editor_columns, editor_config, empty_lesions = lesion_editor()
+    lesions_file = st.file_uploader("Import lesions (CSV in the layout of the lesion export)", type="csv")
+    if lesions_file is not None and st.button("Import lesions"):
+        st.session_state["lesions"] = read_lesions(lesions_file)
+        st.session_state.pop("lesion_editor", None)
+    lesions = st.data_editor(
+        st.session_state.get("lesions", empty_lesions),
+        column_order=editor_columns,
+        column_config=editor_config,
+        num_rows="dynamic",
+        hide_index=True,
+        key="lesion_editor",
+    )
+
+    if st.button("Assess lesions"):
+        values = form_values()
+        patient = {
+            PATIENT_ID: values["patient_id"], AGE: values["age"],
+            HISTORY_CANCER: values["history_cancer"], REASON_REFERRAL: values["reason_referral"],
+        }
+        scored = assess_lesions(lesion_table(lesions, patient))
+        case_store().add_scored(scored)
+        st.session_state["lesions_scored"] = scored
+
+    scored = st.session_state.get("lesions_scored")
+    if scored is not None and len(scored):
+        st.dataframe(patient_summary(scored), hide_index=True)
+        st.dataframe(lesion_results(scored), hide_index=True)
+        st.download_button(
+            label="Save lesions as CSV",
+            data=partial(report_csv, lesion_reports(scored), LESION_REPORT_COLUMNS),
+            file_name='adrenal_mass_lesions.csv',
+            mime='text/csv',
+            on_click="ignore",
+        )
+
+
+@st.fragment(key="cohort")
+def cohort_panel():
+    # Cohorts are held as compact typed columns, so millions of cases fit in a session.
+    # The columnar module, which needs pandas, is imported here rather than when the app is loaded.
+    from adrenal.batch import HISTORY_CANCER, MASS_SIZE, REASON_REFERRAL
+    from adrenal.columnar import CompactCohort
+
+    cohort_file = st.file_uploader("Load a cohort (CSV in the layout of the report export)", type="csv")
+    if cohort_file is not None and st.button("Load cohort"):
+        st.session_state["cohort"] = CompactCohort.read_csv(cohort_file)
+    cohort = st.session_state.get("cohort")
+    if cohort is None:
+        return
+
+    filter_col1, filter_col2, filter_col3 = st.columns(3)
+    mask = np.ones(len(cohort), dtype=bool)
+    if REASON_REFERRAL in cohort.columns:
+        reasons = filter_col1.multiselect("Referral reason", REFERRAL_REASONS, key="cohort_reason")
+        if reasons:
+            mask &= cohort.isin(REASON_REFERRAL, reasons)
+    if MASS_SIZE in cohort.columns:
+        low, high = filter_col2.slider("Mass size (mm)", 0, COHORT_MAX_SIZE, (0, COHORT_MAX_SIZE), key="cohort_size")
+        if (low, high) != (0, COHORT_MAX_SIZE):
+            size = cohort.values(MASS_SIZE)
+            mask &= (size >= low) & (size <= high)
+    if HISTORY_CANCER in cohort.columns and filter_col3.checkbox("History of cancer only", key="cohort_cancer"):
+        mask &= cohort.flag(HISTORY_CANCER)
+
+    matching = cohort if mask.all() else cohort.select(mask)
+    st.caption(f"{len(matching)} of {len(cohort)} cases, {cohort.nbytes / 1e6:.1f} MB in memory")
+    st.dataframe(matching.to_frame(0, COHORT_PREVIEW_ROWS), hide_index=True)
+    st.download_button(
+        label="Export matching cases as CSV",
+        data=matching.csv_file,
+        file_name='adrenal_mass_cohort.csv',
+        mime='text/csv',
+        on_click="ignore",
+    )
+
+
+@st.fragment(key="worklist")
+def worklist_panel():
+    # Worklist of stored cases, filtered and paged in the case store
+    store = case_store()
+    filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
+    worklist_filters = dict(
+        date=filter_col1.date_input("Assessed on", value=None, key="worklist_date"),
+        # No selection (None) matches all cases, so cases with an empty conclusion can be picked too
+        conclusion=filter_col2.selectbox(
+            "Conclusion", [text for text in store.distinct("conclusion") if text is not None], index=None,
+            placeholder="All", format_func=lambda text: text or "(no conclusion)", key="worklist_conclusion",
+        ),
+        size_band=filter_col3.selectbox("Size band", SIZE_BANDS, index=None, placeholder="All", key="worklist_size_band"),
+        reason_referral=filter_col4.selectbox("Referral reason", REFERRAL_REASONS, index=None, placeholder="All",
+                                              key="worklist_reason"),
+    )
+    case_count = store.count(**worklist_filters)
+    page_count = max(1, -(-case_count // WORKLIST_PAGE_SIZE))
+    page = st.number_input("Page", min_value=1, max_value=page_count, value=1, key="worklist_page")
+    st.caption(f"{case_count} cases, page {page} of {page_count}")
+    st.dataframe(
+        store.worklist(page=page - 1, page_size=WORKLIST_PAGE_SIZE, **worklist_filters),
+        column_order=WORKLIST_COLUMNS,
+        hide_index=True,
+    )
+    st.download_button(
+        label="Export matching cases as CSV",
+        data=partial(store.csv_file, **worklist_filters),
+        file_name='adrenal_mass_worklist.csv',
+        mime='text/csv',
+        on_click="ignore",
+    )
+
+
+@st.fragment(key="sweep")
+def sweep_panel():
+    # How the conclusion changes with size and HU for the clinical context of the assessed case
+    if st.toggle("Evaluate the conclusion over size and HU", key="sweep"):
+        sweep = conclusion_sweep().evaluate(DEFAULT_GRID, sweep_context(st.session_state.get("assessed") or form_values()))
+        axis_col1, axis_col2 = st.columns(2)
+        x_axis = axis_col1.selectbox("Horizontal axis", AXES, format_func=AXIS_LABELS.get, key="sweep_x")
+        y_axis = axis_col2.selectbox("Vertical axis", [axis for axis in AXES if axis != x_axis],
+                                     index=1, format_func=AXIS_LABELS.get, key="sweep_y")
+        fixed = {
+            axis: st.select_slider(AXIS_LABELS[axis], getattr(DEFAULT_GRID, axis).values.round(1), key=f"sweep_{axis}")
+            for axis in AXES if axis not in (x_axis, y_axis)
+        }
+        x_values, y_values, rules, captions = grid_slice(sweep, x_axis, y_axis, **fixed)
+        rule_names = np.array([rule.name.replace("_", " ") for rule in FINAL_CONCLUSION_RULES], dtype=object)
+        chart_col1, chart_col2 = st.columns(2)
+        chart_col1.altair_chart(region_chart(x_axis, y_axis, x_values, y_values, rule_names[rules], "Conclusion rule"))
+        chart_col2.altair_chart(region_chart(x_axis, y_axis, x_values, y_values, np.array(CAPTIONS, dtype=object)[captions], "Caption"))
+
+
+rerun_started = time.perf_counter()
+
+# Set page configuration
+st.set_page_config(
+    page_title="Adrenal Mass Approach",
+    page_icon="🯪",
+    layout="wide"
 )
+
+# Title and credits
+st.title("Adrenal Mass Approach")
+st.caption("This app was developed by Peter Sommer Ulriksen and Reza Piri from Radiology Department in Rigshospitalet")
+
+# Create three columns
+col1, col2, col3 = st.columns(3)
+
+# Column 1: Input Data
+with col1:
+    input_panel()
+
+# Column 2: Assessment Results
+with col2:
+    results_panel()
+
+# Column 3: Final Conclusion
+with col3:
+    conclusion_panel()
+
+# Export functionality
+report_panel()
+
+with st.expander("Multiple lesions"):
+    lesions_panel()
+
+with st.expander("Cohort review"):
+    cohort_panel()
+
+with st.expander("Worklist"):
+    worklist_panel()
+
+with st.expander("Conclusion sweep"):
+    sweep_panel()
+
+# Admin panel: rule hit counters and timings of this server process
+with st.expander("Metrics"):
+    if METRICS_ADMIN:
+        # Without a key the toggle follows the shared setting when another session changes it
+        st.toggle("Record metrics", value=METRICS.enabled, on_change=toggle_metrics)
+    else:
+        recording = "on" if METRICS.enabled else "off"
+        st.caption(f"Recording is {recording}. Set ADRENAL_ADMIN=1 to switch it or reset the metrics.")
+    st.dataframe(
+        [
+            {"Metric": name, "Labels": labels_text(labels), "Value": value}
+            for (name, labels), value in sorted({**METRICS.counters(), **METRICS.gauges()}.items())
+        ],
+        hide_index=True,
+    )
+    st.dataframe(
+        [
+            {
+                "Metric": name, "Labels": labels_text(labels), "Count": histogram.count,
+                "Mean (ms)": round(histogram.sum / histogram.count * 1000, 2),
+                "p50 (ms) ≤": quantile(histogram, 0.5) * 1000, "p95 (ms) ≤": quantile(histogram, 0.95) * 1000,
+            }
+            for (name, labels), histogram in sorted(METRICS.histograms().items())
+        ],
+        hide_index=True,
+    )
+    metrics_col1, metrics_col2 = st.columns(2)
+    metrics_col1.download_button(
+        label="Download Prometheus metrics",
+        data=METRICS.exposition,
+        file_name='adrenal_metrics.prom',
+        mime='text/plain',
+        on_click="ignore",
+    )
+    if METRICS_ADMIN and metrics_col2.button("Reset metrics"):
+        METRICS.reset()
+
+if METRICS.enabled:
+    METRICS.observe("adrenal_rerun_seconds", time.perf_counter() - rerun_started, (("assess", "false"),))
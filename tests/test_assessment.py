@@ -0,0 +1,40 @@
+"""Incremental evaluation of the assessment graph."""
+
+import random
+
+from adrenal.assessment import assessment_from, evaluate
+from adrenal.features import CaseFeatures
+from adrenal.rules import MASS_DEV_OPTIONS
+
+# Values each input takes while editing, including the ones the rules branch on
+CHOICES = {
+    "size": [None, 5.0, 10.0, 15.0, 20.0, 34.0, 35.0, 40.0, 45.0, 60.0, 70.0],
+    "non_contrast": [None, -20.0, 0.0, 5.0, 10.0, 15.0, 20.0, 25.0, 40.0, 45.0],
+    "venous": [None, -10.0, 0.0, 10.0, 20.0, 25.0, 30.0, 45.0, 60.0, 130.0],
+    "delayed": [None, 0.0, 10.0, 20.0, 25.0, 30.0, 50.0, 130.0],
+    "fat_percent": [None, 10.0, 24.0, 30.0],
+    "age": [None, 15, 18, 39, 40, 65, 70],
+    "history_cancer": [False, True],
+    "reason_referral": ["Incidentaloma", "Cancer work-up", "Hormonal imbalance", "Other"],
+    "mass_dev": MASS_DEV_OPTIONS,
+    "bilateral": [False, True],
+    "heterogen": [False, True],
+    "macro_fat": [False, True],
+    "calcification": [False, True],
+}
+
+
+def test_incremental_evaluation_matches_full_evaluation():
+    rng = random.Random(0)
+    inputs = {name: rng.choice(values) for name, values in CHOICES.items()}
+    previous = evaluate(CaseFeatures(**inputs)).values
+    for step in range(3000):
+        # Mostly single-field edits, as in the form, with the odd multi-field change
+        for name in rng.sample(sorted(CHOICES), 1 if rng.random() < 0.8 else 3):
+            inputs[name] = rng.choice(CHOICES[name])
+        features = CaseFeatures(**inputs)
+        incremental = evaluate(features, previous)
+        full = evaluate(features)
+        assert incremental.values == full.values, f"step {step}: {inputs}"
+        assert assessment_from(incremental.values) == assessment_from(full.values)
+        previous = incremental.values
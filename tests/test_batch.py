@@ -0,0 +1,78 @@
+"""``assess_cohort`` on cases whose results the form is known to show."""
+
+import math
+
+import pandas as pd
+import pytest
+
+from adrenal.batch import (
+    ABS_WASHOUT, AGE, BENIGN_REASONS, CAPTION, DELAYED_HU, FAT_PERCENT, FINAL_CONCLUSION, MALIGNANT_REASONS,
+    MASS_SIZE, NON_CONTRAST_HU, REASON_REFERRAL, REL_WASHOUT, SMALL_CAPTION_RESULT, USE_CE_CT, USE_DE_CT, USE_NC_CT,
+    VENOUS_PHASE_HU, assess_cohort,
+)
+
+ALL_PHASES = {USE_NC_CT: True, USE_CE_CT: True}
+
+# (inputs, expected results); a washout of None is not shown
+CASES = [
+    (
+        dict(ALL_PHASES, **{MASS_SIZE: "25", NON_CONTRAST_HU: "10", VENOUS_PHASE_HU: "70", DELAYED_HU: "30"}),
+        {
+            ABS_WASHOUT: 200 / 3, REL_WASHOUT: 400 / 7, CAPTION: "Possibly malignant",
+            MALIGNANT_REASONS: "enhancement (HU change > 20), high HU >20 without hematoma pattern",
+            FINAL_CONCLUSION: "Due to low attenuation, no follow-up needed. But, due to the existence of "
+                              "enhancement >10 HU, Consider biochemical assays to determine functional status.",
+        },
+    ),
+    (
+        dict(ALL_PHASES, **{MASS_SIZE: "25", NON_CONTRAST_HU: "30", VENOUS_PHASE_HU: "60", DELAYED_HU: "55"}),
+        {
+            ABS_WASHOUT: 50 / 3, REL_WASHOUT: 25 / 3,
+            MALIGNANT_REASONS: "enhancement (HU change > 20), high HU >20 without hematoma pattern, "
+                               "absolute washout < 60%, relative washout < 40%",
+        },
+    ),
+    # Equal phases: the washout divides by zero and is not shown
+    (
+        dict(ALL_PHASES, **{MASS_SIZE: "25", NON_CONTRAST_HU: "30", VENOUS_PHASE_HU: "30", DELAYED_HU: "20"}),
+        {
+            ABS_WASHOUT: None, REL_WASHOUT: None, MALIGNANT_REASONS: "",
+            FINAL_CONCLUSION: "There is a hematoma enhancement pattern. No follow-up needed.",
+        },
+    ),
+    # "nan" parses like on the form: the absolute washout is NaN, the relative one is computed
+    (
+        dict(ALL_PHASES, **{MASS_SIZE: "45", NON_CONTRAST_HU: "nan", VENOUS_PHASE_HU: "60", DELAYED_HU: "30"}),
+        {
+            ABS_WASHOUT: math.nan, REL_WASHOUT: 50.0, CAPTION: "Probably malignant",
+            MALIGNANT_REASONS: "high HU >20 without hematoma pattern, size > 3.4 cm",
+            FINAL_CONCLUSION: "Consider Resection and biochemical assays.",
+        },
+    ),
+    # One unparsable number discards all of them
+    (
+        {MASS_SIZE: "n/a", USE_NC_CT: True, NON_CONTRAST_HU: "5", AGE: "50"},
+        {CAPTION: "", FINAL_CONCLUSION: "", BENIGN_REASONS: "", MALIGNANT_REASONS: ""},
+    ),
+    (
+        {MASS_SIZE: "8", USE_NC_CT: True, NON_CONTRAST_HU: "5", USE_DE_CT: True, FAT_PERCENT: "30", AGE: "70",
+         REASON_REFERRAL: "Incidentaloma"},
+        {
+            CAPTION: "Benign", SMALL_CAPTION_RESULT: "Benign", BENIGN_REASONS: "fat percent > 24% on DECT",
+            FINAL_CONCLUSION: "The mass is probably a Myelolipoma. No follow-up needed.",
+        },
+    ),
+]
+
+
+@pytest.mark.parametrize("inputs, expected", CASES)
+def test_known_cases(inputs, expected):
+    result = assess_cohort(pd.DataFrame([inputs])).iloc[0]
+    for column, value in expected.items():
+        if column in (ABS_WASHOUT, REL_WASHOUT):
+            if value is None or math.isnan(value):
+                assert math.isnan(result[column]), column
+            else:
+                assert result[column] == pytest.approx(value), column
+        else:
+            assert result[column] == value, column
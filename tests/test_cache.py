@@ -0,0 +1,25 @@
+"""The LRU cache shared by app sessions."""
+
+from adrenal.cache import CacheStats, LRUCache
+
+
+def test_evicts_the_least_recently_used_entry():
+    cache = LRUCache(maxsize=2)
+    computed = []
+
+    def compute(key):
+        computed.append(key)
+        return key * 10
+
+    assert cache.get_or_compute(1, compute) == 10
+    assert cache.get_or_compute(2, compute) == 20
+    # Reading 1 makes 2 the least recently used entry, so adding 3 evicts 2
+    assert cache.get_or_compute(1, compute) == 10
+    assert cache.get_or_compute(3, compute) == 30
+    assert cache.get_or_compute(1, compute) == 10
+    assert cache.get_or_compute(2, compute) == 20
+    assert computed == [1, 2, 3, 2]
+    assert cache.stats() == CacheStats(hits=2, misses=4, size=2, maxsize=2)
+
+    cache.clear()
+    assert cache.stats() == CacheStats(hits=0, misses=0, size=0, maxsize=2)
@@ -0,0 +1,55 @@
+"""Incremental growth sums of the scan store."""
+
+import datetime
+import math
+import random
+
+import pandas as pd
+
+from adrenal.growth import GrowthStore, cohort_growth
+
+
+def test_incremental_growth_matches_cohort_growth(tmp_path):
+    store = GrowthStore(str(tmp_path / "scans.db"))
+    rng = random.Random(0)
+    start = datetime.date(2020, 1, 1)
+    scans = {}
+    for _ in range(600):
+        patient_id = f"p{rng.randrange(40)}"
+        # Some scans land on a day already measured and replace that measurement
+        scan_date = start + datetime.timedelta(days=rng.randrange(0, 1500, 30))
+        size_mm = round(rng.uniform(5, 80), 1)
+        store.add_scan(patient_id, scan_date, size_mm)
+        scans[patient_id, scan_date] = size_mm
+
+    frame = pd.DataFrame(
+        [(patient_id, scan_date.isoformat(), size_mm) for (patient_id, scan_date), size_mm in scans.items()],
+        columns=["patient_id", "scan_date", "size_mm"],
+    )
+    expected = cohort_growth(frame)
+    for patient_id, row in expected.iterrows():
+        growth = store.growth(patient_id)
+        assert growth.n == row["n_scans"]
+        assert growth.category == row["mass_dev"]
+        if growth.rate is None:
+            assert math.isnan(row["growth_mm_per_year"])
+        else:
+            assert math.isclose(growth.rate, row["growth_mm_per_year"], rel_tol=1e-9, abs_tol=1e-9)
+
+
+def test_import_skips_and_counts_bad_rows(tmp_path):
+    store = GrowthStore(str(tmp_path / "scans.db"))
+    text = "\n".join([
+        "patient_id;scan_date;size_mm",
+        "p1;2024-01-01;20",
+        "p1;2025-01-01;30.5",
+        "p1;2025-02-01;",
+        "p1;2025-03-01;n/a",
+        "p1;01/04/2025;25",
+        "p1;2025-05-01;0",
+        "p1;2025-06-01;inf",
+        ";2025-07-01;25",
+        "p1;2025-08-01",
+    ])
+    assert store.import_csv(text) == (2, 7)
+    assert store.history("p1") == [(datetime.date(2024, 1, 1), 20.0), (datetime.date(2025, 1, 1), 30.5)]
@@ -0,0 +1,58 @@
+"""Row-for-row parity of ``assess_cohort`` with ``assess_case``."""
+
+import math
+
+import numpy as np
+import pytest
+
+from adrenal.assessment import assess_case
+from adrenal.batch import (
+    ABS_WASHOUT, BENIGN_REASONS, CAPTION, COMPLEMENTARY_COMMENTS, CONCLUSION_RULE, DELAYED_HU, FAT_PERCENT,
+    FINAL_CONCLUSION, MALIGNANT_REASONS, MASS_SIZE, NON_CONTRAST_HU, PROBABILITY_COMMENTS, REL_WASHOUT,
+    SMALL_CAPTION_RESULT, VENOUS_PHASE_HU, assess_cohort,
+)
+from adrenal.features import CaseFeatures, DerivedFeatures
+from adrenal.synthetic import form_inputs, synthetic_cohort
+
+# Text a reader may type that parses to something other than a plain number
+ODD_TEXT = ["nan", "inf", "-inf", "-0", "0", "1e1", " 12 ", "12,5"]
+
+FIELDS = {
+    "small_caption_result": SMALL_CAPTION_RESULT,
+    "abs_washout": ABS_WASHOUT,
+    "rel_washout": REL_WASHOUT,
+    "benign_reasons": BENIGN_REASONS,
+    "malignant_reasons": MALIGNANT_REASONS,
+    "complementary_comments": COMPLEMENTARY_COMMENTS,
+    "probability_comments": PROBABILITY_COMMENTS,
+    "caption": CAPTION,
+    "final_conclusion": FINAL_CONCLUSION,
+    "conclusion_rule": CONCLUSION_RULE,
+}
+
+
+def _same(expected, actual):
+    if expected is None or isinstance(expected, float):
+        expected = math.nan if expected is None else expected
+        if math.isnan(expected) or math.isnan(actual):
+            return math.isnan(expected) and math.isnan(actual)
+        return math.isclose(expected, actual, rel_tol=1e-9, abs_tol=1e-9)
+    return expected == actual
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_cohort_matches_single_cases(seed):
+    cohort = synthetic_cohort(3000, seed)
+    rng = np.random.default_rng(seed)
+    for column in (MASS_SIZE, NON_CONTRAST_HU, VENOUS_PHASE_HU, DELAYED_HU, FAT_PERCENT):
+        shown = (cohort[column] != "").to_numpy()
+        odd = shown & (rng.random(len(cohort)) < 0.05)
+        cohort.loc[odd, column] = rng.choice(ODD_TEXT, size=odd.sum())
+
+    scored = assess_cohort(cohort, explain=True, lists=True)
+    for index, row in cohort.iterrows():
+        assessment = assess_case(CaseFeatures.from_form(**form_inputs(row)))
+        for field, column in FIELDS.items():
+            expected = getattr(assessment.derived if field in DerivedFeatures._fields else assessment, field)
+            actual = scored.at[index, column]
+            assert _same(expected, actual), f"row {index}, {field}: {expected!r} != {actual!r}"
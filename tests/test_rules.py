@@ -0,0 +1,29 @@
+"""The single-case conclusion encoder against the array one."""
+
+import numpy as np
+
+from adrenal.features import low_attenuation_of
+from adrenal.rules import MASS_DEV_OPTIONS, conclusion_code, conclusion_codes
+
+
+def test_scalar_conclusion_code_matches_arrays():
+    rng = np.random.default_rng(0)
+    count = 5000
+    numbers = [
+        np.where(rng.random(count) < 0.1, np.nan, np.round(rng.uniform(-40, 120, count), 1)) for _ in range(7)
+    ]
+    numbers[0] = np.where(rng.random(count) < 0.05, np.inf, np.abs(numbers[0]) / 2)
+    mass_dev = rng.choice(MASS_DEV_OPTIONS + ["", "other"], count)
+    flags = [rng.random(count) < 0.3 for _ in range(4)]
+    size, fat_percent, non_contrast, venous, delayed, abs_washout, rel_washout = numbers
+    history_cancer, macro_fat, all_phases, calcification = flags
+
+    codes = conclusion_codes(size, mass_dev, history_cancer, macro_fat, fat_percent, non_contrast, venous, delayed,
+                             all_phases, abs_washout, rel_washout, calcification)
+    for row in range(count):
+        # Missing values reach the scalar encoder as None
+        value = [None if np.isnan(column[row]) else float(column[row]) for column in numbers]
+        code = conclusion_code(value[0], str(mass_dev[row]), bool(history_cancer[row]), bool(macro_fat[row]),
+                               value[1], value[2], value[3], value[4], low_attenuation_of(value[2], value[3]),
+                               bool(all_phases[row]), value[5], value[6], bool(calcification[row]))
+        assert code == codes[row], f"row {row}"
@@ -0,0 +1,119 @@
+"""The assessment service over a local connection."""
+
+import asyncio
+import http.client
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from adrenal.service import AssessmentClient, AssessmentService
+
+CASE = {"Mass Size (mm)": "25", "Non-contrast HU": 15, "Venous phase HU": 60, "Delayed HU": 30}
+
+
+async def _shutdown(server):
+    server.close()
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@pytest.fixture
+def serve():
+    """Start an ``AssessmentService`` with the given options on a free port; returns the port."""
+    running = []
+
+    def start(**options):
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(AssessmentService(**options).start("127.0.0.1", 0))
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        running.append((loop, thread, server))
+        return server.sockets[0].getsockname()[1]
+
+    yield start
+    for loop, thread, server in running:
+        asyncio.run_coroutine_threadsafe(_shutdown(server), loop).result(timeout=30)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def post(port, body):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    connection.request("POST", "/assess", body if isinstance(body, str) else json.dumps(body))
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read()), dict(response.getheaders())
+    connection.close()
+    return result
+
+
+def test_assess(serve):
+    client = AssessmentClient(port=serve())
+    result = client.assess(CASE)
+    assert result["caption"]
+    assert client.assess([CASE, CASE]) == [result, result]
+    client.close()
+
+
+def test_result_does_not_depend_on_the_batch(serve):
+    port = serve()
+    alone = post(port, {"Age": 45.5})[1]
+    assert post(port, [{"Age": 45.5}, {"Age": "50"}])[1][0] == alone
+    assert post(port, {"Age": "45.5"})[1] == alone
+
+
+@pytest.mark.parametrize("body", ["{", "[1]", {"Mass Size (mm)": [1]}, [CASE, {"Age": {"years": 50}}]])
+def test_malformed_cases_get_400(serve, body):
+    port = serve()
+    status, result, _ = post(port, body)
+    assert status == 400 and result["error"]
+    # The service keeps answering other requests
+    assert post(port, CASE)[0] == 200
+
+
+@pytest.mark.parametrize("length", ["ten", "-1", "1.5"])
+def test_bad_content_length_gets_400(serve, length):
+    port = serve()
+    with socket.create_connection(("127.0.0.1", port), timeout=30) as connection:
+        connection.sendall(f"POST /assess HTTP/1.1\r\nContent-Length: {length}\r\n\r\n{{}}".encode())
+        response = connection.makefile("rb").read()
+    assert response.startswith(b"HTTP/1.1 400 ")
+    assert b"Connection: close" in response
+    assert post(port, CASE)[0] == 200
+
+
+def test_more_cases_than_the_queue_holds_get_413(serve):
+    status, _, _ = post(serve(max_queue=4), [CASE] * 5)
+    assert status == 413
+
+
+def test_full_queue_gets_503(serve):
+    # The batcher waits max_delay for a batch to fill, so the first request's cases stay queued meanwhile
+    port = serve(max_queue=4, max_delay=1.0)
+    first = threading.Thread(target=post, args=(port, [CASE] * 4))
+    first.start()
+    health = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    for _ in range(100):
+        health.request("GET", "/health")
+        if json.loads(health.getresponse().read())["queued"]:
+            break
+        time.sleep(0.01)
+    status, _, headers = post(port, [CASE] * 2)
+    first.join()
+    health.close()
+    assert status == 503
+    assert headers["Retry-After"] == "1"
+
+
+def test_scoring_error_gets_500(serve, monkeypatch):
+    def fail(cases):
+        raise RuntimeError("scoring failed")
+
+    monkeypatch.setattr("adrenal.service.score_cases", fail)
+    status, result, _ = post(serve(), CASE)
+    assert status == 500 and result["error"]
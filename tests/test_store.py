@@ -0,0 +1,60 @@
+"""Worklist filters and paging of the case store."""
+
+import datetime
+import io
+
+from adrenal.assessment import assess_case
+from adrenal.features import CaseFeatures
+from adrenal.store import CaseStore
+
+REASONS = ["Cancer work-up", "Incidentaloma", ""]
+
+
+def _assessed_at(number, day):
+    return datetime.datetime.combine(day, datetime.time(9, number))
+
+
+def _numbers(rows):
+    """Case numbers of worklist rows, read back from the minute they were assessed at."""
+    return [datetime.datetime.fromisoformat(row["assessed_at"]).minute for row in rows]
+
+
+def _fill(store):
+    """Store 30 cases over three days; returns them as (day, size, reason) triples."""
+    cases = []
+    for number in range(30):
+        day = datetime.date(2026, 1, 1 + number % 3)
+        size = [5.0, 15.0, 30.0, 50.0, None][number % 5]
+        reason = REASONS[number % 3 if number % 2 else 0]
+        features = CaseFeatures(size, 15.0, 60.0, 30.0, None, 50, False, reason, "No prior scanning",
+                                False, False, False, False)
+        report = {"Mass Size (mm)": "" if size is None else str(size), "Reason of Referral": reason}
+        store.add(report, features, assess_case(features), _assessed_at(number, day))
+        cases.append((day, size, reason))
+    return cases
+
+
+def test_filters_and_paging(tmp_path):
+    store = CaseStore(str(tmp_path / "cases.db"))
+    cases = _fill(store)
+
+    assert store.count() == 30
+    day = datetime.date(2026, 1, 2)
+    expected = [number for number, case in enumerate(cases) if case[0] == day and case[2] == "Cancer work-up"]
+    assert store.count(date=day, reason_referral="Cancer work-up") == len(expected)
+    # None matches every case, "" only the cases without a referral reason
+    assert store.count(reason_referral=None) == 30
+    assert store.count(reason_referral="") == sum(case[2] == "" for case in cases)
+    assert store.count(size_band="missing") == sum(case[1] is None for case in cases)
+    assert store.distinct("size_band") == ["10-20", "20-40", "<=10", ">=40", "missing"]
+
+    # Pages run newest first without gaps or repeats
+    pages = [store.worklist(page=page, page_size=7) for page in range(5)]
+    assert [len(rows) for rows in pages] == [7, 7, 7, 7, 2]
+    assert [number for rows in pages for number in _numbers(rows)] == list(range(29, -1, -1))
+    filtered = store.worklist(page=0, page_size=50, date=day, reason_referral="Cancer work-up")
+    assert _numbers(filtered) == expected[::-1]
+
+    exported = io.StringIO()
+    store.write_csv(exported, date=day)
+    assert len(exported.getvalue().splitlines()) == 1 + sum(case[0] == day for case in cases)
@@ -0,0 +1,38 @@
+"""The conclusion sweep agrees with single-case assessments at its grid points."""
+
+import itertools
+
+import pytest
+
+from adrenal.assessment import assess_case
+from adrenal.features import CaseFeatures
+from adrenal.rules import FINAL_CONCLUSION_RULES, MASS_DEV_OPTIONS
+from adrenal.sweep import CAPTIONS, Axis, ConclusionSweep, Grid, SweepContext
+
+# Steps of 10 and 20 land on the thresholds of the rules
+GRID = Grid(size=Axis(0, 80, 9), non_contrast=Axis(-20, 80, 11), venous=Axis(-20, 200, 12), delayed=Axis(-20, 200, 12))
+
+CONTEXTS = [
+    SweepContext(history_cancer=False, mass_dev=MASS_DEV_OPTIONS[0], macro_fat=False, calcification=False,
+                 fat_percent=None),
+    SweepContext(history_cancer=True, mass_dev=MASS_DEV_OPTIONS[1], macro_fat=False, calcification=True,
+                 fat_percent=30.0),
+    SweepContext(history_cancer=False, mass_dev=MASS_DEV_OPTIONS[3], macro_fat=True, calcification=False,
+                 fat_percent=10.0),
+]
+
+
+@pytest.mark.parametrize("context", CONTEXTS)
+def test_sweep_matches_single_cases(context):
+    result = ConclusionSweep().evaluate(GRID, context)
+    axes = [axis.values for axis in GRID]
+    for index in itertools.product(*(range(len(values)) for values in axes)):
+        size, non_contrast, venous, delayed = (float(values[i]) for values, i in zip(axes, index))
+        # As on the form, a negative HU sets macroscopic fat
+        macro_fat = context.macro_fat or non_contrast < 0 or venous < 0
+        assessment = assess_case(CaseFeatures(
+            size, non_contrast, venous, delayed, context.fat_percent, None, context.history_cancer, "",
+            context.mass_dev, False, False, macro_fat, context.calcification,
+        ))
+        assert FINAL_CONCLUSION_RULES[result.rules[index]].name == assessment.conclusion_rule, index
+        assert CAPTIONS[result.captions[index]] == assessment.caption, index